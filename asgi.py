@@ -0,0 +1,210 @@
+"""ASGI entry point for the virtual assistant.
+
+    uvicorn asgi:app
+
+POST /chat is handled on the event loop: Wikipedia and NewsAPI lookups and
+the SymPy solver run on executors with per-call timeouts, so a slow upstream
+doesn't hold up greetings and math. Every other route (uploads, the page,
+/stats) is the regular Flask app, run on a thread pool with its body streamed
+back chunk by chunk. Request bodies over MAX_CONTENT_LENGTH are turned away
+with a 413 before or while they arrive; other routes' bodies are spooled to a
+temporary file once they outgrow ASGI_SPOOL_BYTES.
+"""
+import asyncio
+import io
+import os
+import sys
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import request
+
+import main
+
+WSGI_THREADS = int(os.environ.get('WSGI_THREADS', 16))
+wsgi_executor = ThreadPoolExecutor(max_workers=WSGI_THREADS, thread_name_prefix="wsgi")
+SPOOL_BYTES = int(os.environ.get('ASGI_SPOOL_BYTES', 1024 * 1024))
+
+
+class BodyTooLarge(Exception):
+    pass
+
+
+def content_length(scope):
+    for name, value in scope.get("headers", []):
+        if name == b"content-length":
+            try:
+                return int(value)
+            except ValueError:
+                return None
+    return None
+
+
+async def iter_body(receive):
+    """Yield the request body's chunks, raising BodyTooLarge once it passes MAX_CONTENT_LENGTH"""
+    limit = main.app.config['MAX_CONTENT_LENGTH']
+    size = 0
+    while True:
+        message = await receive()
+        chunk = message.get("body", b"")
+        size += len(chunk)
+        if limit is not None and size > limit:
+            raise BodyTooLarge()
+        yield chunk
+        if not message.get("more_body"):
+            return
+
+
+async def read_body(receive):
+    return b"".join([chunk async for chunk in iter_body(receive)])
+
+
+async def spool_body(receive):
+    """Read the body into a file object: memory for small bodies, a temporary file past SPOOL_BYTES"""
+    spool = tempfile.SpooledTemporaryFile(max_size=SPOOL_BYTES)
+    try:
+        async for chunk in iter_body(receive):
+            spool.write(chunk)
+    except BaseException:
+        spool.close()
+        raise
+    spool.seek(0)
+    return spool
+
+
+async def send_response(send, response):
+    await send({
+        "type": "http.response.start",
+        "status": response.status_code,
+        "headers": [(name.lower().encode("latin1"), value.encode("latin1")) for name, value in response.headers.items()],
+    })
+    await send({"type": "http.response.body", "body": response.get_data()})
+
+
+async def send_too_large(send):
+    """The app's own 413 reply, sent without reading the rest of the body"""
+    with main.app.app_context():
+        response = main.app.make_response(main.upload_too_large(None))
+    await send_response(send, response)
+
+
+def build_environ(scope, stream):
+    """Translate an ASGI HTTP scope and its body stream into a WSGI environ for Flask"""
+    server = scope.get("server") or ("localhost", 80)
+    environ = {
+        "REQUEST_METHOD": scope["method"],
+        "SCRIPT_NAME": scope.get("root_path", ""),
+        "PATH_INFO": scope["path"],
+        "QUERY_STRING": scope.get("query_string", b"").decode("latin1"),
+        "SERVER_NAME": server[0],
+        "SERVER_PORT": str(server[1]),
+        "SERVER_PROTOCOL": f"HTTP/{scope.get('http_version', '1.1')}",
+        "REMOTE_ADDR": (scope.get("client") or ("", 0))[0],
+        "wsgi.version": (1, 0),
+        "wsgi.url_scheme": scope.get("scheme", "http"),
+        "wsgi.input": stream,
+        "wsgi.errors": sys.stderr,
+        "wsgi.multithread": True,
+        "wsgi.multiprocess": True,
+        "wsgi.run_once": False,
+    }
+    for name, value in scope.get("headers", []):
+        name, value = name.decode("latin1"), value.decode("latin1")
+        if name == "content-type":
+            key = "CONTENT_TYPE"
+        elif name == "content-length":
+            key = "CONTENT_LENGTH"
+        else:
+            key = "HTTP_" + name.upper().replace("-", "_")
+        environ[key] = f"{environ[key]},{value}" if key in environ else value
+    return environ
+
+
+async def chat(scope, receive, send):
+    environ = build_environ(scope, io.BytesIO(await read_body(receive)))
+    # A Flask request context gives the handlers the usual request and session,
+    # and process_response() saves the session cookie as the sync view would
+    with main.app.request_context(environ):
+        response = main.app.preprocess_request()
+        if response is None:
+            user_message = (request.get_json(silent=True) or {}).get("message", "")
+            reply = await main.assistant_logic_async(user_message)
+            response = main.chat_response(reply)
+        response = main.app.process_response(main.app.make_response(response))
+    await send_response(send, response)
+
+
+def run_wsgi(environ, loop, events):
+    """Call the Flask app on a worker thread, handing the status line and body chunks to the loop"""
+    def start_response(status, headers, exc_info=None):
+        loop.call_soon_threadsafe(events.put_nowait, ("start", status, headers))
+
+    body = main.app(environ, start_response)
+    try:
+        for chunk in body:
+            if chunk:
+                loop.call_soon_threadsafe(events.put_nowait, ("body", chunk, None))
+    finally:
+        if hasattr(body, "close"):
+            body.close()
+
+
+async def wsgi(scope, receive, send):
+    """Serve a request with the regular Flask app without blocking the event loop"""
+    body = await spool_body(receive)
+    try:
+        await serve_wsgi(scope, body, send)
+    finally:
+        body.close()
+
+
+async def serve_wsgi(scope, body, send):
+    loop = asyncio.get_running_loop()
+    events = asyncio.Queue()
+    done = loop.run_in_executor(wsgi_executor, run_wsgi, build_environ(scope, body), loop, events)
+    done.add_done_callback(lambda _: events.put_nowait(("end", None, None)))
+
+    started = False
+    while True:
+        kind, value, headers = await events.get()
+        if kind == "start":
+            await send({
+                "type": "http.response.start",
+                "status": int(value.split(" ", 1)[0]),
+                "headers": [(name.lower().encode("latin1"), v.encode("latin1")) for name, v in headers],
+            })
+            started = True
+        elif kind == "body":
+            await send({"type": "http.response.body", "body": value, "more_body": True})
+        else:
+            break
+    await done  # re-raise anything the app raised
+    if started:
+        await send({"type": "http.response.body", "body": b""})
+
+
+async def app(scope, receive, send):
+    if scope["type"] == "lifespan":
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                main.start_background_services()
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+    elif scope["type"] != "http":
+        return
+    else:
+        limit = main.app.config['MAX_CONTENT_LENGTH']
+        length = content_length(scope)
+        if limit is not None and length is not None and length > limit:
+            await send_too_large(send)
+            return
+        try:
+            if scope["path"] == "/chat" and scope["method"] == "POST":
+                await chat(scope, receive, send)
+            else:
+                await wsgi(scope, receive, send)
+        except BodyTooLarge:
+            await send_too_large(send)
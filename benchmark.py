@@ -0,0 +1,597 @@
+"""Micro benchmarks for the virtual assistant.
+
+Run a single benchmark with:  python benchmark.py <name>
+or every benchmark with:      python benchmark.py
+"""
+import os
+import sys
+import time
+
+import main
+from fixtures import fake_upstream_env, free_port, make_document, make_image, make_image_bytes, make_pdf, start_fake_upstreams
+
+
+def timeit(func, repeat=2000):
+    """Return the average time of func() in microseconds"""
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    return (time.perf_counter() - start) / repeat * 1e6
+
+
+# --- Intent Router ---
+ROUTER_MESSAGES = [
+    "hello there",
+    "open youtube please",
+    "tell me a story",
+    "what's the weather like on mars today",  # falls through every intent
+    "i keep sneezing, could this be a cold",
+]
+
+def bench_router():
+    """Per-message routing cost as the number of registered intents grows"""
+    print("intents | router (us/msg) | linear scan (us/msg)")
+    for extra in (0, 100, 1000, 10000):
+        router = main.build_intent_router()
+        triggers = [f"synthetic trigger {i}" for i in range(extra)]
+        for i, trigger in enumerate(triggers):
+            router.register(f"synthetic_{i}", 1000 + i, [trigger], main.static_reply("synthetic"))
+        router.compile()
+
+        def route():
+            for message in ROUTER_MESSAGES:
+                router.match(message)
+
+        # The old approach: one substring test per trigger, in order
+        all_triggers = [t for intent in router.intents.values() for t in intent["triggers"]]
+
+        def scan():
+            for message in ROUTER_MESSAGES:
+                for trigger in all_triggers:
+                    if trigger in message:
+                        break
+
+        n = len(ROUTER_MESSAGES)
+        print(f"{len(router.intents):7d} | {timeit(route, 500) / n:15.2f} | {timeit(scan, 50) / n:20.2f}")
+
+
+# --- Metrics ---
+def bench_metrics():
+    """Cost of the per-intent instrumentation compared to dispatching a message"""
+    router = main.build_intent_router()
+    metrics = main.LatencyMetrics()
+
+    def timed():
+        with metrics.timer("intent", "greeting"):
+            pass
+
+    def dispatch():
+        for message in ROUTER_MESSAGES:
+            router.dispatch(message)
+
+    print(f"metrics.observe() : {timeit(lambda: metrics.observe('intent', 'greeting', 0.002), 20000):6.2f} us")
+    print(f"metrics.timer()   : {timeit(timed, 20000):6.2f} us")
+    print(f"router.dispatch() : {timeit(dispatch, 200) / len(ROUTER_MESSAGES):6.2f} us/msg (instrumented)")
+
+
+# --- Arithmetic ---
+SPOKEN_EXPRESSIONS = [
+    "12 plus 8 divided by 2",
+    "100 minus 45 into 2",
+    "7 mod 3",
+    "3 x 4 x 5",
+    "(2 plus 3) x (4 minus 1)",
+    "2 ** 10",
+    "1.5 plus 2.25 divided by 0.5",
+    "-(8 minus 3) x -2",
+]
+
+def eval_arithmetic(expression):
+    """The previous regex + eval() implementation, kept for comparison"""
+    import re
+    expression = expression.lower()
+    expression = expression.replace("plus", "+").replace("minus", "-")
+    expression = expression.replace("x", "*").replace("into", "*")
+    expression = expression.replace("divided by", "/").replace("mod", "%")
+    if re.match(r"^[\d\s\+\-\*/%\.\(\)]+$", expression):
+        return f"The answer is: {eval(expression)}"
+    return None
+
+def bench_arithmetic():
+    """evaluate_math_expression vs. the old eval() path on spoken-style input"""
+    for expression in SPOKEN_EXPRESSIONS:
+        assert main.evaluate_math_expression(expression) == eval_arithmetic(expression), expression
+
+    def old():
+        for expression in SPOKEN_EXPRESSIONS:
+            eval_arithmetic(expression)
+
+    def cold():
+        main.arithmetic_cache.clear()
+        for expression in SPOKEN_EXPRESSIONS:
+            main.evaluate_math_expression(expression)
+
+    def warm():
+        for expression in SPOKEN_EXPRESSIONS:
+            main.evaluate_math_expression(expression)
+
+    n = len(SPOKEN_EXPRESSIONS)
+    print(f"eval() path       : {timeit(old) / n:8.2f} us/expr")
+    print(f"parser (no cache) : {timeit(cold) / n:8.2f} us/expr")
+    print(f"parser (memoized) : {timeit(warm) / n:8.2f} us/expr")
+
+
+# --- PDF extraction ---
+def bench_pdf():
+    """Old += extraction vs. the streaming extractor, serial and in worker processes"""
+    import io
+    import tempfile
+    from PyPDF2 import PdfReader
+
+    def old_read(data):
+        text = ""
+        for page in PdfReader(io.BytesIO(data)).pages:
+            text += page.extract_text()
+        return text
+
+    for pages in (50, 500):
+        data = make_pdf(pages)
+        with tempfile.NamedTemporaryFile(suffix=".pdf") as handle:
+            handle.write(data)
+            handle.flush()
+
+            start = time.perf_counter()
+            expected = old_read(data)
+            old_time = time.perf_counter() - start
+
+            start = time.perf_counter()
+            serial = "".join(main.iter_pdf_pages(io.BytesIO(data)))
+            serial_time = time.perf_counter() - start
+
+            main.get_pdf_executor().submit(int).result()  # exclude worker start-up from the timing
+            start = time.perf_counter()
+            parallel = "".join(main.iter_pdf_pages(handle.name))
+            parallel_time = time.perf_counter() - start
+
+            # Time until the upload path can store the first pages
+            start = time.perf_counter()
+            chunks = main.iter_pdf_chunks(handle.name)
+            first_chunk = next(chunks)
+            first_time = time.perf_counter() - start
+            for _ in chunks:
+                pass
+
+        assert serial == expected and parallel == expected and expected.startswith(first_chunk)
+        print(f"{pages:4d} pages | old {old_time:6.2f}s | streaming {serial_time:6.2f}s | "
+              f"from path ({main.PDF_WORKERS} workers) {parallel_time:6.2f}s | first chunk {first_time:6.2f}s")
+
+
+# --- DOCX extraction ---
+def bench_docx():
+    """python-docx object model vs. the streaming extractor on table-heavy documents"""
+    import io
+    import tracemalloc
+    from fixtures import make_table_docx
+
+    def measure(func, data):
+        start = time.perf_counter()
+        text = func(io.BytesIO(data))
+        elapsed = time.perf_counter() - start
+        # Separate run for memory: tracing slows the extractors down
+        tracemalloc.start()
+        func(io.BytesIO(data))
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        return text, elapsed, peak
+
+    main.read_docx_document(io.BytesIO(make_table_docx(1)))  # import python-docx outside the timing
+    for tables, merged in ((20, False), (200, False), (200, True)):
+        data = make_table_docx(tables, merged=merged)
+        old, old_time, old_peak = measure(main.read_docx_document, data)
+        new, new_time, new_peak = measure(lambda f: "\n".join(main.iter_docx_blocks(f)), data)
+        if not merged:  # python-docx repeats merged cells, so only unmerged output matches
+            assert sorted(old.splitlines()) == sorted(new.splitlines())
+        label = f"{tables} tables{' (merged)' if merged else ''}"
+        print(f"{label:20s} {len(data) // 1024:5d} KB | python-docx {old_time:6.2f}s {old_peak / 2 ** 20:6.1f} MB | "
+              f"streaming {new_time:6.2f}s {new_peak / 2 ** 20:5.1f} MB")
+
+
+# --- Image captioning ---
+def bench_captions():
+    """Caption throughput at 1/8/32 concurrent uploads, unbatched vs. micro-batched"""
+    from concurrent.futures import ThreadPoolExecutor
+    try:
+        main.load_image_models()
+    except Exception as e:
+        print(f"skipped: BLIP models unavailable ({e})")
+        return
+
+    for label, max_batch in (("unbatched", 1), ("batched", main.caption_engine.max_batch)):
+        engine = main.CaptionEngine(main.load_image_models, max_batch=max_batch,
+                                    max_wait_ms=main.caption_engine.max_wait * 1000)
+        engine.caption(make_image(0))  # warm-up
+        for concurrency in (1, 8, 32):
+            images = [make_image(i) for i in range(concurrency * 2)]
+            start = time.perf_counter()
+            with ThreadPoolExecutor(concurrency) as pool:
+                list(pool.map(engine.caption, images))
+            elapsed = time.perf_counter() - start
+            print(f"{label:9s} | {concurrency:2d} concurrent | {len(images) / elapsed:6.2f} images/s")
+
+
+# --- Code snippets ---
+def bench_snippets():
+    """Snippet lookup: old lower()-and-scan loop vs. the indexed, lazily loaded library"""
+    import json
+    import os
+    import tempfile
+
+    message = "can you show me the program for quick sort in python"
+    for size in (100, 1000, 10000):
+        library = {f"algorithm {i}": f"def algorithm_{i}():\n    return {i}\n" * 20 for i in range(size)}
+        library["quick sort"] = "def quick_sort(items):\n    ..."
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "programs.json")
+            with open(path, "w") as f:
+                json.dump(library, f)
+
+            def scan():
+                for key in library:
+                    if key.lower() in message.lower():
+                        return library[key]
+
+            index = main.SnippetIndex(path)
+            router = main.IntentRouter()
+            router.register("program", 0, [k.lower() for k in index.keys()], lambda m, t: index[t])
+            router.compile()
+            assert router.dispatch(message) == scan()
+            print(f"{size:6d} snippets | scan {timeit(scan, 200):8.2f} us | index {timeit(lambda: router.dispatch(message), 200):6.2f} us")
+
+
+
+
+# --- Response cache ---
+REPEATED_MESSAGES = ["What is AI?", "what is ai", "integrate sin(x)", "Integrate sin(x).", "about malaria",
+                     "i have a bad cold", "12 plus 8 divided by 2", "tell me a story"]
+
+def bench_responses():
+    """assistant_logic on commonly repeated messages: answered from the response cache vs. dispatched.
+
+    The Wikipedia, math and caption backends already cache their own
+    results, so this measures what the response cache saves on top of them.
+    """
+    import json
+    import tempfile
+    with tempfile.NamedTemporaryFile("w", suffix=".json", delete=False) as f:
+        json.dump({"ai": "Artificial intelligence is intelligence shown by machines. " * 20,
+                   "malaria": "Malaria is a disease spread by mosquitoes. " * 20}, f)
+    main.wikipedia_backend = main.FixtureWikipediaBackend(f.name)
+    print("message                   | dispatched (us) | cached (us)")
+    for message in REPEATED_MESSAGES:
+        with main.app.test_request_context("/chat", method="POST", headers={"X-Cache-Bypass": "1"}):
+            main.assistant_logic(message)  # fill the backend caches
+            dispatched = timeit(lambda: main.assistant_logic(message), 500)
+        with main.app.test_request_context("/chat", method="POST"):
+            main.assistant_logic(message)
+            cached = timeit(lambda: main.assistant_logic(message), 500)
+        print(f"{message:25s} | {dispatched:15.1f} | {cached:11.1f}")
+    os.remove(f.name)
+    print(main.response_cache.stats())
+
+# --- Diseases ---
+DISEASE_MESSAGES = [
+    "i have a bad cold",
+    "what about malaria",
+    "tell me about condition 9999",
+    "what's the weather like on mars today",
+]
+SYMPTOM_MESSAGES = [
+    "fever and chills",
+    "i keep getting body aches and a cough",
+]
+
+def synthetic_diseases(size):
+    """`size` made-up conditions, each with an alias and four symptoms from a shared pool"""
+    import random
+    rng = random.Random(size)
+    pool = [f"symptom {i}" for i in range(500)] + ["fever", "chills", "cough", "body aches", "fatigue"]
+    return [{
+        "id": f"condition_{i}",
+        "name": f"Condition {i}",
+        "aliases": [f"syndrome {i}"],
+        "symptoms": "Synthetic.",
+        "symptom_terms": rng.sample(pool, 4),
+        "cause": "Synthetic.",
+        "treatment": "Synthetic.",
+        "severity": "Mild",
+    } for i in range(size)]
+
+def bench_diseases():
+    """Disease lookup as the catalogue grows: old substring scan vs. the inverted index.
+
+    Symptom lookups grow with how many conditions share the symptoms (about 1
+    in 100 here), not with the size of the catalogue.
+    """
+    import json
+    import tempfile
+
+    with open(main.DISEASE_DATA_PATH) as f:
+        shipped = json.load(f)
+    print("conditions | build (ms) | scan (us/msg) | index by name (us/msg) | index by symptoms (us/msg)")
+    for size in (0, 100, 1000, 10000):
+        entries = shipped + synthetic_diseases(size)
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "diseases.json")
+            with open(path, "w") as f:
+                json.dump(entries, f)
+            start = time.perf_counter()
+            index = main.DiseaseIndex(path)
+            build = (time.perf_counter() - start) * 1000
+
+        router = main.IntentRouter()
+        router.register("disease", 0, index.trigger_words(), lambda m, t: index.lookup(m, limit=3) or None)
+        router.compile()
+
+        # The old approach: one substring test per condition key, in order
+        keys = [entry["id"] for entry in entries]
+
+        def scan():
+            for message in DISEASE_MESSAGES:
+                next((key for key in keys if key in message), None)
+
+        def lookup(messages):
+            for message in messages:
+                router.dispatch(message)
+
+        by_name = timeit(lambda: lookup(DISEASE_MESSAGES), 500) / len(DISEASE_MESSAGES)
+        by_symptoms = timeit(lambda: lookup(SYMPTOM_MESSAGES), 500) / len(SYMPTOM_MESSAGES)
+        print(f"{len(index):10d} | {build:10.1f} | {timeit(scan, 50) / len(DISEASE_MESSAGES):13.2f} | "
+              f"{by_name:22.2f} | {by_symptoms:26.2f}")
+
+# --- Startup ---
+STARTUP_BUDGET_MS = float(os.environ.get("STARTUP_BUDGET_MS", 1000))
+
+def bench_startup():
+    """Import-time report and time to first response; exits 1 if over STARTUP_BUDGET_MS"""
+    import subprocess
+    env = dict(os.environ, PREWARM_IMPORTS="0")
+    directory = os.path.dirname(os.path.abspath(main.__file__))
+
+    report = subprocess.run([sys.executable, "-X", "importtime", "-c", "import main"],
+                            cwd=directory, env=env, capture_output=True, text=True).stderr
+    rows = []
+    for line in report.splitlines():
+        if line.startswith("import time:") and "|" in line and "cumulative" not in line:
+            _, cumulative, name = line[len("import time:"):].split("|")
+            rows.append((int(cumulative), name.strip()))
+    print("slowest imports (cumulative ms):")
+    for cumulative, name in sorted(rows, reverse=True)[:10]:
+        print(f"  {cumulative / 1000:8.1f}  {name}")
+
+    # Fresh interpreter -> import the app -> answer one request; best of three
+    script = "import main; main.app.test_client().get('/test')"
+    runs = []
+    for _ in range(3):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, "-c", script], cwd=directory, env=env, check=True, capture_output=True)
+        runs.append((time.perf_counter() - start) * 1000)
+    cold_start = min(runs)
+    print(f"time to first response: {cold_start:.0f} ms (budget {STARTUP_BUDGET_MS:.0f} ms)")
+    if cold_start > STARTUP_BUDGET_MS:
+        print("FAIL: cold start is over budget")
+        sys.exit(1)
+
+
+# --- Summarization ---
+def bench_summarize():
+    """summarize_text on 10k/100k/1M-word documents, directly and through upload + 'summarize'"""
+    import io
+    for words in (10000, 100000, 1000000):
+        text = make_document(words)
+        main.summary_cache.clear()
+        start = time.perf_counter()
+        main.summarize_text(text)
+        cold = time.perf_counter() - start
+        start = time.perf_counter()
+        main.summarize_text(text)
+        cached = time.perf_counter() - start
+        print(f"{words:8d} words | scoring {cold * 1000:7.0f} ms | cached {cached * 1000:6.2f} ms")
+
+    # 100k words end to end: upload the file, then ask for a summary
+    main.summary_cache.clear()
+    client = main.app.test_client()
+    data = make_document(100000).encode()
+    start = time.perf_counter()
+    client.post("/upload?wait=60", data={"file": (io.BytesIO(data), "report.txt")}, content_type="multipart/form-data")
+    reply = client.post("/chat", json={"message": "summarize"}).get_json()
+    elapsed = time.perf_counter() - start
+    assert reply["text"].startswith("📄 **Summary:**"), reply
+    print(f"upload + summarize (100k words, {len(data) // 1024} KB): {elapsed * 1000:.0f} ms")
+
+
+
+# --- Upload jobs ---
+def bench_uploads():
+    """Text upload latency while images are queued, and how many uploads a full queue turns away"""
+    import io
+    main.caption_engine = main.FixtureCaptionEngine(delay_ms=200, max_batch=8, max_wait_ms=20)
+    client = main.app.test_client()
+
+    def post(name, data, wait=0):
+        return client.post(f"/upload?wait={wait}", data={"file": (io.BytesIO(data), name)},
+                           content_type="multipart/form-data")
+
+    for images in (0, 16, 64):
+        statuses = [post(f"{i}.png", make_image_bytes(i + images * 100, size=(64, 64))).status_code for i in range(images)]
+        latencies = []
+        for i in range(10):
+            start = time.perf_counter()
+            post("notes.txt", make_document(2000).encode(), wait=30)
+            latencies.append((time.perf_counter() - start) * 1000)
+        latencies.sort()
+        start = time.perf_counter()
+        while any(main.upload_jobs.stats()[f"image_{state}"] for state in ("queued", "running")):
+            time.sleep(0.01)
+        print(f"{images:3d} images posted ({statuses.count(503):2d} turned away) | "
+              f"txt upload p50 {latencies[5]:6.1f} ms | image backlog drained {time.perf_counter() - start:5.2f}s later")
+
+# --- Read-out ---
+def bench_readout():
+    """Old one-body "read out" reply vs. time to the first streamed chunk"""
+    import io
+    import json
+    for words in (100000, 1000000):
+        text = make_document(words)
+        client = main.app.test_client()
+        client.post("/upload?wait=60", data={"file": (io.BytesIO(text.encode()), "report.txt")}, content_type="multipart/form-data")
+
+        start = time.perf_counter()
+        old_body = json.dumps({"text": "📖 Reading the full document...", "speak": text, "full_content": text})
+        old_time = time.perf_counter() - start
+
+        client.post("/chat", json={"message": "read out"})
+        start = time.perf_counter()
+        response = client.get("/read?format=jsonl", buffered=False)
+        stream = response.response
+        next(iter(stream))
+        first_time = time.perf_counter() - start
+        total = sum(1 for _ in stream) + 1
+        total_time = time.perf_counter() - start
+        response.close()
+        print(f"{words:8d} words | one body {len(old_body) / 2 ** 20:5.1f} MB in {old_time * 1000:6.1f} ms | "
+              f"first chunk {first_time * 1000:5.1f} ms | {total} chunks in {total_time * 1000:6.0f} ms")
+
+
+# --- Worker memory ---
+def smaps_rollup(pid):
+    memory = {}
+    with open(f"/proc/{pid}/smaps_rollup") as f:
+        for line in f:
+            name, _, rest = line.partition(":")
+            if name in ("Rss", "Pss"):
+                memory[name.lower()] = int(rest.split()[0]) / 1024
+    return memory
+
+def bench_workers():
+    """Per-worker RSS/PSS under gunicorn -c gunicorn.conf.py, with and without pre-fork preloading"""
+    import subprocess
+    import tempfile
+    import requests
+    from fixtures import make_docx
+
+    workers = 3
+    upstreams = start_fake_upstreams(0.01)
+    directory = os.path.dirname(os.path.abspath(main.__file__))
+    for preload in ("0", "1"):
+        port = free_port()
+        state = tempfile.mkdtemp()
+        env = dict(os.environ, **fake_upstream_env(upstreams), GUNICORN_PRELOAD=preload, GUNICORN_WORKERS=str(workers),
+                   GUNICORN_BIND=f"127.0.0.1:{port}", SHARED_CACHE_PATH=os.path.join(state, "cache.db"),
+                   DOCUMENT_STORE_PATH=os.path.join(state, "documents.db"))
+        process = subprocess.Popen([sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "main:app"],
+                                   cwd=directory, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            url = f"http://127.0.0.1:{port}"
+            for _ in range(300):
+                try:
+                    requests.get(url + "/test", timeout=1)
+                    break
+                except requests.ConnectionError:
+                    time.sleep(0.1)
+            time.sleep(1)
+            with open(f"/proc/{process.pid}/task/{process.pid}/children") as f:
+                pids = [int(pid) for pid in f.read().split()]
+            before = {pid: smaps_rollup(pid) for pid in pids}
+
+            # Touch every feature from several sessions so each worker imports what it needs
+            for i in range(workers * 4):
+                session = requests.Session()
+                session.post(url + "/chat", json={"message": f"about zorblax {i}"})
+                session.post(url + "/upload?wait=60", files={"file": ("a.docx", make_docx(20))})
+                session.post(url + "/chat", json={"message": "summarize"})
+                session.post(url + "/upload?wait=60", files={"file": ("a.png", make_image_bytes(i))})
+            time.sleep(2)  # let the pre-warm threads finish
+            after = {pid: smaps_rollup(pid) for pid in pids}
+        finally:
+            process.terminate()
+            process.wait()
+
+        print(f"preload={preload}: worker | RSS before -> after (MB) | PSS before -> after (MB)")
+        for pid in pids:
+            print(f"  {pid:7d} | {before[pid]['rss']:6.1f} -> {after[pid]['rss']:6.1f} | "
+                  f"{before[pid]['pss']:6.1f} -> {after[pid]['pss']:6.1f}")
+        print(f"  total PSS after traffic: {sum(m['pss'] for m in after.values()):.1f} MB")
+    upstreams.shutdown()
+
+
+# --- Async request path ---
+def bench_asgi():
+    """Fast-intent latency while Wikipedia is slow: sync workers vs. the ASGI entry point"""
+    import subprocess
+    import requests
+    from concurrent.futures import ThreadPoolExecutor
+
+    delay, slow_requests, fast_requests = 1.0, 16, 40
+    upstreams = start_fake_upstreams(delay)
+    directory = os.path.dirname(os.path.abspath(main.__file__))
+    env = dict(os.environ, PREWARM_IMPORTS="0", **fake_upstream_env(upstreams))
+
+    servers = {
+        "gunicorn (2 sync workers)": ["gunicorn", "-w", "2", "-b", "127.0.0.1:{port}", "main:app"],
+        "uvicorn asgi:app": ["uvicorn", "asgi:app", "--port", "{port}", "--log-level", "warning"],
+    }
+    for label, command in servers.items():
+        port = free_port()
+        url = f"http://127.0.0.1:{port}/chat"
+        process = subprocess.Popen([sys.executable, "-m"] + [c.format(port=port) for c in command],
+                                   cwd=directory, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            for _ in range(100):
+                try:
+                    requests.post(url, json={"message": "hello"}, timeout=1)
+                    break
+                except requests.ConnectionError:
+                    time.sleep(0.1)
+
+            def post(message):
+                start = time.perf_counter()
+                requests.post(url, json={"message": message}, timeout=30).raise_for_status()
+                return time.perf_counter() - start
+
+            with ThreadPoolExecutor(slow_requests + fast_requests) as pool:
+                slow = [pool.submit(post, f"about zorblax {i}") for i in range(slow_requests)]
+                time.sleep(0.1)  # let the slow lookups occupy the server first
+                fast = [pool.submit(post, message) for message in ["hello", "12 plus 8"] * (fast_requests // 2)]
+                fast = sorted(f.result() * 1000 for f in fast)
+                slow = sorted(f.result() * 1000 for f in slow)
+            print(f"{label:26s} | fast p50 {fast[len(fast) // 2]:7.0f} ms  p99 {fast[-1]:7.0f} ms"
+                  f" | wikipedia p50 {slow[len(slow) // 2]:7.0f} ms")
+        finally:
+            process.terminate()
+            process.wait()
+    upstreams.shutdown()
+
+
+BENCHMARKS = {
+    "router": bench_router,
+    "metrics": bench_metrics,
+    "responses": bench_responses,
+    "arithmetic": bench_arithmetic,
+    "pdf": bench_pdf,
+    "docx": bench_docx,
+    "captions": bench_captions,
+    "snippets": bench_snippets,
+    "diseases": bench_diseases,
+    "startup": bench_startup,
+    "asgi": bench_asgi,
+    "summarize": bench_summarize,
+    "readout": bench_readout,
+    "uploads": bench_uploads,
+    "workers": bench_workers,
+}
+
+if __name__ == "__main__":
+    names = sys.argv[1:] or list(BENCHMARKS)
+    for name in names:
+        print(f"=== {name} ===")
+        BENCHMARKS[name]()
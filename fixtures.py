@@ -0,0 +1,167 @@
+"""Synthetic uploads and fake upstream servers for benchmark.py and replay.py.
+
+Nothing here imports main, so callers can point the app at the fakes (via
+fake_upstream_env()) before it is imported.
+"""
+import json
+import random
+import socket
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+
+# --- Synthetic documents ---
+def make_pdf(pages, lines_per_page=40):
+    """Build a plain-text PDF with the given number of pages, without extra dependencies"""
+    objects = ["<< /Type /Catalog /Pages 2 0 R >>", None, "<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    kids = []
+    for page in range(pages):
+        lines = [f"Page {page + 1} line {line + 1}: the quick brown fox jumps over the lazy dog." for line in range(lines_per_page)]
+        stream = "BT /F1 10 Tf 40 800 Td 12 TL " + " ".join(f"({text}) '" for text in lines) + " ET"
+        objects.append(f"<< /Length {len(stream)} >>\nstream\n{stream}\nendstream")
+        objects.append(f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 842] "
+                       f"/Resources << /Font << /F1 3 0 R >> >> /Contents {len(objects)} 0 R >>")
+        kids.append(f"{len(objects)} 0 R")
+    objects[1] = f"<< /Type /Pages /Kids [{' '.join(kids)}] /Count {pages} >>"
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, 1):
+        offsets.append(len(out))
+        out += f"{number} 0 obj\n{body}\nendobj\n".encode("latin-1")
+    xref = len(out)
+    out += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode("latin-1")
+    out += "".join(f"{offset:010d} 00000 n \n" for offset in offsets).encode("latin-1")
+    out += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode("latin-1")
+    return bytes(out)
+
+SUMMARY_TOPICS = ["rainfall", "harvest", "irrigation", "market prices", "soil health", "crop insurance"]
+
+def make_document(words):
+    """Prose-like text of roughly `words` words, mixing a few recurring topics"""
+    rng = random.Random(words)
+    filler = "the farmers in the district said that this season was different from the last one".split()
+    sentences, count = [], 0
+    while count < words:
+        topic = rng.choice(SUMMARY_TOPICS)
+        sentence = " ".join(rng.sample(filler, 8)) + f" because of {topic} and {rng.choice(SUMMARY_TOPICS)}"
+        sentences.append(sentence.capitalize())
+        count += len(sentence.split())
+    return ". ".join(sentences) + "."
+
+def make_docx(paragraphs, tables=0):
+    """A .docx with the given number of paragraphs (and 3x3 tables), as bytes"""
+    import io
+    from docx import Document
+    document = Document()
+    text = make_document(paragraphs * 12).split(". ")
+    for i in range(paragraphs):
+        document.add_paragraph(text[i % len(text)] + ".")
+    for t in range(tables):
+        table = document.add_table(rows=3, cols=3)
+        for r, row in enumerate(table.rows):
+            for c, cell in enumerate(row.cells):
+                cell.text = f"table {t} cell {r}.{c}"
+    out = io.BytesIO()
+    document.save(out)
+    return out.getvalue()
+
+def make_table_docx(tables, rows=50, cols=6, merged=False):
+    """A table-heavy .docx written as raw XML (python-docx is too slow to build large ones).
+
+    Each table follows a heading paragraph; with merged=True the first two
+    cells of every row are one horizontally merged cell.
+    """
+    import io
+    import zipfile
+    w = 'xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main"'
+    parts = []
+    for t in range(tables):
+        parts.append(f"<w:p><w:r><w:t>Section {t + 1}: quarterly figures for region {t % 12}.</w:t></w:r></w:p>")
+        parts.append("<w:tbl><w:tblGrid>" + "<w:gridCol/>" * cols + "</w:tblGrid>")
+        for r in range(rows):
+            cells = []
+            for c in range(cols):
+                if merged and c == 1:
+                    continue
+                span = '<w:tcPr><w:gridSpan w:val="2"/></w:tcPr>' if merged and c == 0 else ""
+                cells.append(f"<w:tc>{span}<w:p><w:r><w:t>r{r}c{c} {t * rows + r}</w:t></w:r></w:p></w:tc>")
+            parts.append("<w:tr>" + "".join(cells) + "</w:tr>")
+        parts.append("</w:tbl>")
+    document = f'<?xml version="1.0" encoding="UTF-8" standalone="yes"?><w:document {w}><w:body>{"".join(parts)}<w:sectPr/></w:body></w:document>'
+    out = io.BytesIO()
+    with zipfile.ZipFile(out, "w", zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr("[Content_Types].xml",
+                         '<?xml version="1.0" encoding="UTF-8"?><Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+                         '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+                         '<Default Extension="xml" ContentType="application/xml"/>'
+                         '<Override PartName="/word/document.xml" ContentType="application/vnd.openxmlformats-officedocument.wordprocessingml.document.main+xml"/></Types>')
+        archive.writestr("_rels/.rels",
+                         '<?xml version="1.0" encoding="UTF-8"?><Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+                         '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" Target="word/document.xml"/></Relationships>')
+        archive.writestr("word/document.xml", document)
+    return out.getvalue()
+
+def make_image(seed, size=(640, 480)):
+    from PIL import Image
+    return Image.new("RGB", size, ((seed * 37) % 256, (seed * 91) % 256, (seed * 53) % 256))
+
+def make_image_bytes(seed, size=(640, 480), format="PNG"):
+    import io
+    out = io.BytesIO()
+    make_image(seed, size).save(out, format=format)
+    return out.getvalue()
+
+
+# --- Fake upstreams ---
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def start_fake_upstreams(delay=0.05):
+    """A local stand-in for the MediaWiki API (/w/api.php) and NewsAPI (/v2/top-headlines).
+
+    Every request takes `delay` seconds, so slow upstreams can be simulated.
+    """
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            time.sleep(delay)
+            url = urlparse(self.path)
+            params = parse_qs(url.query)
+            if url.path.endswith("/top-headlines"):
+                category = params.get("category", ["general"])[0]
+                body = {"articles": [{"title": f"{category.title()} headline {i + 1}"} for i in range(10)]}
+            elif "srsearch" in params:
+                body = {"query": {"search": [{"title": params["srsearch"][0]}]}}
+            else:
+                title = params["titles"][0]
+                text = " ".join(f"{title} fact number {i + 1} is described here." for i in range(12))
+                body = {"query": {"pages": {"1": {"extract": text}}}}
+            data = json.dumps(body).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", free_port()), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def fake_upstream_env(server, caption_ms=50):
+    """Environment that points the app at the fake upstreams and the fixture captioner"""
+    base = f"http://127.0.0.1:{server.server_port}"
+    return {
+        "WIKIPEDIA_BACKEND": "live",
+        "WIKIPEDIA_API_URL": f"{base}/w/api.php",
+        "NEWSAPI_URL": f"{base}/v2",
+        "CAPTION_BACKEND": "fixture",
+        "CAPTION_FIXTURE_MS": str(caption_ms),
+    }
@@ -0,0 +1,43 @@
+"""gunicorn settings for running the assistant with several worker processes.
+
+    gunicorn -c gunicorn.conf.py main:app
+
+The app is loaded once in the master (GUNICORN_PRELOAD=1). Its libraries,
+the BLIP model and the read-only data are then shared copy-on-write by the
+forked workers instead of being loaded by each of them. Documents and the
+caption, Wikipedia and math caches go through SQLite files, so a request can
+be served by any worker.
+"""
+import os
+
+# Read by main at import time, which happens after this file is loaded
+os.environ.setdefault("DOCUMENT_STORE", "sqlite")
+os.environ.setdefault("SHARED_CACHE_PATH", "cache.db")
+
+bind = os.environ.get("GUNICORN_BIND", "127.0.0.1:5000")
+workers = int(os.environ.get("GUNICORN_WORKERS", 2))
+threads = int(os.environ.get("GUNICORN_THREADS", 4))
+preload_app = os.environ.get("GUNICORN_PRELOAD", "1") == "1"
+timeout = 120
+
+
+def mb(value):
+    return f"{value / 2 ** 20:.1f} MB"
+
+
+def when_ready(server):
+    # Runs in the master after the app is loaded and before the first fork
+    if preload_app:
+        import main
+        main.preload_for_fork()
+        memory = main.process_memory()
+        server.log.info("Preloaded app in master %s: RSS %s", os.getpid(), mb(memory["rss"]))
+
+
+def post_fork(server, worker):
+    import main
+    # Worker processes and threads don't survive the fork, so each worker starts its own
+    main.start_background_services()
+    memory = main.process_memory()
+    server.log.info("Worker %s booted: RSS %s, PSS %s, shared %s",
+                    worker.pid, mb(memory["rss"]), mb(memory.get("pss", 0)), mb(memory["shared"]))
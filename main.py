@@ -1,534 +1,2842 @@
-from flask import Flask, request, jsonify, render_template, session
-import datetime
-import re
-import json
-import os
-from sympy import symbols, Eq, solve, simplify, diff, integrate, limit, sympify
-import random
-
-from docx import Document
-
-app = Flask(__name__)
-app.secret_key = os.environ.get('FLASK_SECRET_KEY', 'a-strong-default-secret-key-for-dev')  # Use environment variable
-
-# --- Load Code Snippets from JSON (with error handling) ---
-try:
-    if os.path.exists('programs.json'):
-        with open('programs.json') as f:
-            code_snippets = json.load(f)
-    else:
-        print("Warning: programs.json not found. Creating empty dict.")
-        code_snippets = {}
-except Exception as e:
-    print(f"Error loading programs.json: {e}")
-    code_snippets = {}
-
-# --- Image Captioning Setup (lazy loading) ---
-processor = None
-model = None
-
-def load_image_models():
-    """Lazy load the image captioning models only when needed"""
-    global processor, model
-    if processor is None or model is None:
-        try:
-            from transformers import BlipProcessor, BlipForConditionalGeneration
-            print("Loading BLIP models... This may take a while.")
-            processor = BlipProcessor.from_pretrained("Salesforce/blip-image-captioning-base")
-            model = BlipForConditionalGeneration.from_pretrained("Salesforce/blip-image-captioning-base")
-            print("Models loaded successfully!")
-        except Exception as e:
-            print(f"Error loading models: {e}")
-            raise
-
-def get_image_caption(image):
-    """Get caption for an image"""
-    try:
-        load_image_models()
-        inputs = processor(images=image, return_tensors="pt")
-        out = model.generate(**inputs)
-        caption = processor.decode(out[0], skip_special_tokens=True)
-        return caption
-    except Exception as e:
-        return f"Error generating caption: {str(e)}"
-
-# --- Document Summarization ---
-def summarize_text(text, max_sentences=5):
-    """Extract main points from text"""
-    try:
-        # Split into sentences
-        sentences = re.split(r'[.!?]+', text)
-        sentences = [s.strip() for s in sentences if len(s.strip()) > 20]
-        
-        # Simple extractive summarization - take first few sentences and some from middle/end
-        if len(sentences) <= max_sentences:
-            summary = ". ".join(sentences) + "."
-        else:
-            # Take sentences from different parts of the document
-            indices = [0, 1]  # First two sentences
-            middle_idx = len(sentences) // 2
-            indices.append(middle_idx)
-            
-            # Add more if needed
-            remaining = max_sentences - len(indices)
-            step = len(sentences) // (remaining + 1)
-            for i in range(remaining):
-                idx = step * (i + 1)
-                if idx < len(sentences) and idx not in indices:
-                    indices.append(idx)
-            
-            indices.sort()
-            selected_sentences = [sentences[i] for i in indices if i < len(sentences)]
-            summary = ". ".join(selected_sentences) + "."
-        
-        # Add bullet points for main points
-        main_points = []
-        for sentence in sentences[:10]:  # Look at first 10 sentences for keywords
-            # Extract potential key points (sentences with important keywords)
-            if any(word in sentence.lower() for word in ['important', 'main', 'key', 'significant', 'crucial', 'essential', 'primary']):
-                main_points.append(sentence.strip())
-        
-        result = "📄 **Summary:**\n\n" + summary
-        
-        if main_points:
-            result += "\n\n**Main Points:**\n"
-            for i, point in enumerate(main_points[:3], 1):
-                result += f"\n{i}. {point}"
-        
-        return result
-    except Exception as e:
-        return f"Error summarizing text: {str(e)}"
-
-# --- Story Generation --- 
-def generate_story(key_points):
-    story_templates = [
-        "Once upon a time, there was a {character} who was {adjective}. One day, they discovered {discovery}. This discovery led them on a journey to {destination}, where they encountered {obstacle}. With determination and courage, they overcame the obstacle and {resolution}.",
-        "In a distant land, a {character} set out on an adventure to {goal}. Along the way, they faced many challenges, including {challenge}. But through wisdom and bravery, they succeeded in {achievement}. Their journey became a legend, known far and wide as the {story_name}.",
-        "A {adjective} {character} found themselves caught in an unexpected situation. While trying to {action}, they stumbled upon {discovery}. This started a chain of events that led to {unexpected_turn}. In the end, they learned {lesson}, and their life was changed forever."
-    ]
-
-    story_data = {
-        "character": "knight" if "knight" in str(key_points) else "hero",
-        "adjective": "brave" if "brave" in str(key_points) else "kind",
-        "discovery": "a hidden treasure" if "treasure" in str(key_points) else "a powerful artifact",
-        "destination": "a distant castle" if "castle" in str(key_points) else "an enchanted forest",
-        "obstacle": "a dangerous dragon" if "dragon" in str(key_points) else "an evil sorcerer",
-        "resolution": "became a legend" if "legend" in str(key_points) else "defeated the dark forces",
-        "goal": "defeat the evil forces" if "evil" in str(key_points) else "find a rare artifact",
-        "challenge": "treacherous terrain" if "terrain" in str(key_points) else "a fierce monster",
-        "achievement": "saving the kingdom" if "kingdom" in str(key_points) else "finding the treasure",
-        "story_name": "The Brave Knight's Quest" if "knight" in str(key_points) else "The Hero's Journey",
-        "action": "fight the sorcerer" if "fight" in str(key_points) else "seek the hidden treasure",
-        "unexpected_turn": "they realized the treasure was cursed" if "cursed" in str(key_points) else "they were betrayed by an ally",
-        "lesson": "the true meaning of courage" if "courage" in str(key_points) else "the importance of friendship"
-    }
-
-    story_template = random.choice(story_templates)
-    story = story_template.format(**story_data)
-    return story
-
-# --- Basic Math Expression Evaluation ---
-def evaluate_math_expression(expression):
-    try:
-        expression = expression.lower()
-        expression = expression.replace("plus", "+").replace("minus", "-")
-        expression = expression.replace("x", "*").replace("into", "*")
-        expression = expression.replace("divided by", "/").replace("mod", "%")
-        if re.match(r"^[\d\s\+\-\*/%\.\(\)]+$", expression):
-            result = eval(expression)
-            return f"The answer is: {result}"
-        return None
-    except Exception:
-        return None
-
-# --- Advanced Math Solver ---
-def advanced_math_solver(expression):
-    try:
-        x = symbols('x')
-        expression = expression.lower().replace("^", "**")
-
-        if "solve" in expression:
-            eq = expression.replace("solve", "").strip()
-            lhs, rhs = eq.split("=")
-            equation = Eq(sympify(lhs), sympify(rhs))
-            result = solve(equation, x)
-            return f"Solution: {result}"
-        elif "differentiate" in expression or "derivative" in expression:
-            expr = expression.replace("differentiate", "").replace("derivative", "").strip()
-            return f"Derivative: {diff(sympify(expr))}"
-        elif "integrate" in expression:
-            expr = expression.replace("integrate", "").strip()
-            return f"Integral: {integrate(sympify(expr))}"
-        elif "simplify" in expression:
-            expr = expression.replace("simplify", "").strip()
-            return f"Simplified: {simplify(sympify(expr))}"
-        elif "limit" in expression:
-            expr = expression.replace("limit", "").strip()
-            return f"Limit as x approaches ∞: {limit(sympify(expr), x, float('inf'))}"
-        return None
-    except Exception as e:
-        return f"Sorry, I couldn't solve that. Error: {str(e)}"
-
-# --- Disease Info Handler ---
-def get_disease_info(message):
-    disease_data = {
-        "cold": {
-            "name": "Common Cold",
-            "symptoms": "Runny nose, sore throat, cough, congestion, slight body aches.",
-            "cause": "Caused by a viral infection (usually rhinovirus).",
-            "treatment": "Rest, hydration, and over-the-counter cold medications.",
-            "severity": "Mild"
-        },
-        "fever": {
-            "name": "Fever",
-            "symptoms": "High body temperature, chills, sweating, headache, body aches.",
-            "cause": "Usually due to an infection (bacterial or viral).",
-            "treatment": "Stay hydrated, take paracetamol or ibuprofen, and rest.",
-            "severity": "Mild to Moderate"
-        },
-        "covid": {
-            "name": "COVID-19",
-            "symptoms": "Fever, cough, fatigue, shortness of breath, loss of taste or smell.",
-            "cause": "Caused by SARS-CoV-2 virus, spreads through droplets.",
-            "treatment": "Isolation, monitoring symptoms, and seeking medical help if needed.",
-            "severity": "Varies from Mild to Severe"
-        },
-        "malaria": {
-            "name": "Malaria",
-            "symptoms": "Fever, chills, vomiting, headache, muscle pain.",
-            "cause": "Spread by Anopheles mosquitoes carrying Plasmodium parasite.",
-            "treatment": "Antimalarial medications prescribed by doctors.",
-            "severity": "Moderate to Severe"
-        },
-        "diabetes": {
-            "name": "Diabetes",
-            "symptoms": "Increased thirst, frequent urination, fatigue, blurred vision.",
-            "cause": "High blood sugar due to insulin issues (Type 1 or 2).",
-            "treatment": "Managed with medication, insulin, diet control, and exercise.",
-            "severity": "Chronic"
-        },
-        "hypertension": {
-            "name": "Hypertension",
-            "symptoms": "Often silent, may include headache, shortness of breath, or nosebleeds.",
-            "cause": "High pressure in the arteries. Risk factor for heart disease.",
-            "treatment": "Lifestyle changes and antihypertensive drugs.",
-            "severity": "Chronic"
-        },
-        "headache": {
-            "name": "Headache",
-            "symptoms": "Pain in head, scalp, or neck. Can be dull or sharp.",
-            "cause": "Stress, dehydration, sinus issues, eye strain, or more serious causes.",
-            "treatment": "Rest, hydration, and over-the-counter pain relievers.",
-            "severity": "Mild to Moderate"
-        }
-    }
-
-    for keyword, info in disease_data.items():
-        if keyword in message:
-            return (
-                f"🩺 *{info['name']}*\n"
-                f"- **Symptoms**: {info['symptoms']}\n"
-                f"- **Cause**: {info['cause']}\n"
-                f"- **Treatment**: {info['treatment']}\n"
-                f"- **Severity**: {info['severity']}"
-            )
-    return None
-
-# --- Program Snippet Handler ---
-def get_program_snippet(message):
-    for key in code_snippets:
-        if key.lower() in message.lower():
-            return f"Here is the {key} program:\n```python\n{code_snippets[key]}\n```"
-    return None
-
-# --- Wikipedia Info ---
-def get_wikipedia_info(query, more=False):
-    try:
-        import wikipedia
-
-        if not more:
-            session['wiki_topic'] = query
-            session['wiki_offset'] = 0
-        else:
-            query = session.get('wiki_topic')
-            session['wiki_offset'] = session.get('wiki_offset', 0) + 2
-
-        if not query:
-            return "Please ask about a topic first."
-        
-        offset = session.get('wiki_offset', 0)
-        summary = wikipedia.summary(query, sentences=offset + 2)
-        paragraphs = summary.split(". ")
-        start = offset
-        end = start + 2
-        more_info = ". ".join(paragraphs[start:end])
-        return more_info if more_info else "No more information available."
-    except Exception as e:
-        return f"Sorry, I couldn't find information on that topic. Error: {str(e)}"
-
-# --- Current Affairs ---
-def get_current_affairs():
-    """Fetches top news headlines from NewsAPI."""
-    try:
-        import requests
-
-        # API Key for NewsAPI.org. For better security, consider moving this to an environment variable.
-
-        api_key = "26d03ad1d52f4222a123717cc2dea0b5"
-        
-        # Fetch top headlines from India. You can change the country code (e.g., 'us' for USA).
-        url = f"https://newsapi.org/v2/top-headlines?country=in&apiKey={api_key}"
-        response = requests.get(url)
-        response.raise_for_status()  # Raise an exception for bad status codes
-        
-        articles = response.json().get("articles", [])
-        if not articles:
-            return "Sorry, I couldn't fetch the latest news right now."
-
-        headlines = ["📰 Here are the top 5 headlines:"] + [f"- {article['title']}" for article in articles[:5]]
-        return "\n".join(headlines)
-    except Exception as e:
-        print(f"Error fetching current affairs: {e}")
-        return "Sorry, I'm having trouble fetching the news at the moment."
-
-# --- Assistant Logic ---
-def assistant_logic(send):
-    data_btn = send.lower()
-
-    # Check if user is responding to document action request
-    if 'pending_document' in session and session['pending_document']:
-        if "read" in data_btn or "read out" in data_btn or "full" in data_btn:
-            content = session.get('document_content', '')
-            session['pending_document'] = False
-            return {
-                "text": "📖 Reading the full document...",
-                "speak": content,
-                "full_content": content
-            }
-        elif "summarize" in data_btn or "summary" in data_btn or "short" in data_btn or "main points" in data_btn:
-            content = session.get('document_content', '')
-            session['pending_document'] = False
-            summary = summarize_text(content)
-            return {
-                "text": summary,
-                "speak": summary,
-                "full_content": None
-            }
-        else:
-            return {
-                "text": "Please choose an option: 'read out' for full content or 'summarize' for main points.",
-                "speak": "Please choose read out or summarize",
-                "full_content": None
-            }
-
-    if "what is your name" in data_btn:
-        return "My name is Virtual Assistant"
-    elif any(greet in data_btn for greet in ["hello", "hye", "hay", "hi"]):
-        return "Hey sir, how can I help you!"
-    elif "how are you" in data_btn:
-        return "I am doing great these days, sir."
-    elif "thanku" in data_btn or "thank" in data_btn:
-        return "It's my pleasure, sir, to stay with you."
-    elif "good morning" in data_btn:
-        return "Good morning sir, I think you might need some help."
-    elif "time now" in data_btn:
-        now = datetime.datetime.now()
-        return now.strftime("Current time is %I:%M %p")
-    elif "current affairs" in data_btn:
-        return get_current_affairs()
-    elif "open youtube" in data_btn:
-        return "OPEN_YOUTUBE"
-    elif "open google" in data_btn:
-        return "OPEN_GOOGLE"
-    elif "open facebook" in data_btn:
-        return "OPEN_FACEBOOK"
-    elif "open sbtet" in data_btn:
-        return "OPEN_SBTET"
-    elif "open music" in data_btn:
-        return "OPEN_MUSIC"
-    elif "shutdown" in data_btn or "quit" in data_btn:
-        return "Ok sir. Shutting down."
-
-    if data_btn.startswith(("about ", "who is ", "what is ")):
-        topic = data_btn.replace("about", "").replace("who is", "").replace("what is", "").strip()
-        return get_wikipedia_info(topic, more=False)
-    elif "more about him" in data_btn or "more about her" in data_btn:
-        return get_wikipedia_info("", more=True)
-
-    program_result = get_program_snippet(data_btn)
-    if program_result:
-        return program_result
-
-    basic_result = evaluate_math_expression(data_btn)
-    if basic_result:
-        return basic_result
-
-    advanced_result = advanced_math_solver(data_btn)
-    if advanced_result:
-        return advanced_result
-
-    disease_result = get_disease_info(data_btn)
-    if disease_result:
-        return disease_result
-
-    if "tell me a story" in data_btn:
-        key_points = {"character": "young prince", "setting": "magical forest", "conflict": "an evil dragon", "resolution": "outsmarting the dragon using clever tricks"}
-        story = generate_story(key_points)
-        return story
-
-    return "Sorry, I didn't understand that. Try asking about diseases, math problems, or say 'open YouTube' or upload a file or image."
-
-# --- File Reading Functions ---
-def read_pdf_file(file):
-    try:
-        from PyPDF2 import PdfReader
-        reader = PdfReader(file)
-        text = ""
-        for page in reader.pages:
-            text += page.extract_text()
-        return text
-    except Exception as e:
-        return f"Error reading PDF: {str(e)}"
-
-def read_docx_file(file):
-    """Read DOCX file with fixed import"""
-    try:
-        import io
-
-        # Read file content into memory
-        file_content = file.read()
-        file_stream = io.BytesIO(file_content)
-        
-        # Open document from stream
-        doc = Document(file_stream)
-        
-        # Extract all text
-        full_text = []
-        for para in doc.paragraphs:
-            if para.text.strip():
-                full_text.append(para.text)
-
-        # Extract text from tables (if any)
-        for table in doc.tables:
-            for row in table.rows:
-                row_text = []
-                for cell in row.cells:
-                    cell_text = cell.text.strip()
-                    if cell_text:
-                        row_text.append(cell_text)
-                if row_text:
-                    full_text.append(" | ".join(row_text))
-
-        result = "\n".join(full_text)
-
-        if not result.strip():
-            return "The document appears to be empty."
-        
-        return result
-        
-    except ImportError:
-        return "Error: python-docx library not installed. Run: pip install python-docx"
-    except Exception as e:
-        return f"Error reading DOCX file: {str(e)}"
-
-def read_txt_file(file):
-    try:
-        return file.read().decode("utf-8")
-    except Exception as e:
-        return f"Error reading TXT: {str(e)}"
-
-# --- Image Recognition and Captioning ---
-@app.route('/upload', methods=['POST'])
-def upload():
-    file = request.files.get('file') or request.files.get('image')
-    if file:
-        filename = file.filename.lower()
-        try:
-            if filename.endswith(('.png', '.jpg', '.jpeg', '.bmp')): 
-                from PIL import Image
-                import io
-                img = Image.open(io.BytesIO(file.read()))
-                caption = get_image_caption(img)
-
-                weapons = ["gun", "knife", "pistol", "bomb", "rifle"]
-                detected_weapons = [weapon for weapon in weapons if weapon in caption.lower()]
-
-                if detected_weapons:
-                    warning_message = f"⚠️ Warning: Possible weapon detected ({', '.join(detected_weapons)})."
-                    caption = warning_message + "\n" + caption
-
-                return jsonify({"caption": caption})
-
-            elif filename.endswith('.pdf'):
-                content = read_pdf_file(file)
-                # Store content in session for later processing
-                session['document_content'] = content
-                session['pending_document'] = True
-                return jsonify({
-                    "type": "document",
-                    "message": "📄 Document uploaded successfully! What would you like me to do?\n\n1️⃣ Type 'read out' - I'll read the full document\n2️⃣ Type 'summarize' - I'll extract main points for better understanding",
-                    "speak": "Document uploaded. What would you like me to do? Say read out for full content, or summarize for main points."
-                })
-            
-            elif filename.endswith('.docx'):
-                content = read_docx_file(file)
-                
-                # Check if there was an error reading the file
-                if content.startswith("Error"):
-                    return jsonify({"status": "error", "message": content})
-                
-                # Store content in session for later processing
-                session['document_content'] = content
-                session['pending_document'] = True
-                return jsonify({
-                    "type": "document",
-                    "message": "📄 Document uploaded successfully! What would you like me to do?\n\n1️⃣ Type 'read out' - I'll read the full document\n2️⃣ Type 'summarize' - I'll extract main points for better understanding",
-                    "speak": "Document uploaded. What would you like me to do? Say read out for full content, or summarize for main points."
-                })
-            
-            elif filename.endswith('.txt'):
-                content = read_txt_file(file)
-                session['document_content'] = content
-                session['pending_document'] = True
-                return jsonify({
-                    "type": "document",
-                    "message": "📄 Text file uploaded successfully! What would you like me to do?\n\n1️⃣ Type 'read out' - I'll read the full document\n2️⃣ Type 'summarize' - I'll extract main points for better understanding",
-                    "speak": "Text file uploaded. What would you like me to do? Say read out for full content, or summarize for main points."
-                })
-            else:
-                return jsonify({"status": "error", "message": "Unsupported file type"})
-        
-        except Exception as e:
-            return jsonify({"status": "error", "message": str(e)})
-    
-    return jsonify({"status": "no file uploaded"})
-
-# --- Routes ---
-@app.route("/")
-def index():
-    return render_template("index.html")
-
-@app.route("/chat", methods=["POST"])
-def chat():
-    user_message = request.json.get("message", "")
-    reply = assistant_logic(user_message)
-    
-    # Handle different reply types
-    if isinstance(reply, dict):
-        return jsonify(reply)
-    else:
-        return jsonify({"reply": reply})
-
-# Test route to verify server is running
-@app.route("/test")
-def test():
-    return "Flask server is running!"
-
-if __name__ == "__main__":
-    print("=" * 50)
-    print("Starting Flask Virtual Assistant...")
-    print("=" * 50)
-    print(f"Server will start at: http://127.0.0.1:5000/")
-    print("Press CTRL+C to quit")
-    print("=" * 50)
+from flask import Flask, request, jsonify, render_template, session, g, Response
+import datetime
+import time
+import re
+import json
+import os
+import random
+import asyncio
+import bisect
+import contextvars
+import queue
+import threading
+import uuid
+from collections import deque, OrderedDict
+from contextlib import contextmanager
+
+app = Flask(__name__)
+app.secret_key = os.environ.get('FLASK_SECRET_KEY', 'a-strong-default-secret-key-for-dev')  # Use environment variable
+
+# --- Load Code Snippets from JSON (indexed, bodies read on demand) ---
+class SnippetIndex:
+    """Byte-offset index over programs.json.
+
+    Only the keys and the position of each value stay in memory; a snippet
+    body is read from the open file with os.pread when it is asked for. The
+    index is rebuilt when the file's modification time changes, or when a
+    read comes back short or undecodable because the file was rewritten in
+    place.
+    """
+
+    def __init__(self, path, check_interval=1.0):
+        self.path = path
+        self.check_interval = check_interval
+        self.offsets = {}  # key -> (start, end) byte span of the JSON value
+        self.mtime = None
+        self.checked_at = 0
+        self.file = None
+        # Set when a read had to reindex, so the next reload_if_changed() reports it
+        self.reindexed = False
+        self.lock = threading.Lock()
+        self.load()
+
+    def load(self):
+        offsets, mtime, file = {}, None, None
+        try:
+            if os.path.exists(self.path):
+                file = open(self.path, 'rb')
+                mtime = os.fstat(file.fileno()).st_mtime
+                data = file.read()
+                if data:
+                    offsets = self._scan(data.decode('utf-8'))
+            else:
+                print(f"Warning: {self.path} not found. Creating empty dict.")
+        except Exception as e:
+            print(f"Error loading {self.path}: {e}")
+            offsets = {}
+        with self.lock:
+            old_file = self.file
+            self.offsets, self.mtime, self.file = offsets, mtime, file
+        if old_file is not None:
+            old_file.close()
+
+    @staticmethod
+    def _scan(text):
+        """Walk the top-level JSON object, recording the byte span of every value"""
+        decoder = json.JSONDecoder()
+        whitespace = re.compile(r'\s*')
+        offsets = {}
+        # Characters and bytes differ for non-ASCII text, so track both positions
+        byte_pos, char_pos = 0, 0
+
+        def to_bytes(index):
+            nonlocal byte_pos, char_pos
+            byte_pos += len(text[char_pos:index].encode('utf-8'))
+            char_pos = index
+            return byte_pos
+
+        idx = whitespace.match(text, 0).end()
+        if text[idx:idx + 1] != '{':
+            raise ValueError("programs.json must contain a JSON object")
+        idx = whitespace.match(text, idx + 1).end()
+        while text[idx:idx + 1] != '}':
+            if text[idx:idx + 1] != '"':
+                raise ValueError(f"expected a key at position {idx}")
+            key, idx = json.decoder.scanstring(text, idx + 1)
+            idx = whitespace.match(text, idx).end()
+            if text[idx:idx + 1] != ':':
+                raise ValueError(f"expected ':' at position {idx}")
+            start = whitespace.match(text, idx + 1).end()
+            _, end = decoder.raw_decode(text, start)
+            # A repeated key overrides the earlier one, as with json.load
+            offsets[key] = (to_bytes(start), to_bytes(end))
+            idx = whitespace.match(text, end).end()
+            if text[idx:idx + 1] == ',':
+                idx = whitespace.match(text, idx + 1).end()
+        return offsets
+
+    def reload_if_changed(self):
+        """Rebuild the index if programs.json changed; returns True if it did"""
+        if self.reindexed:
+            self.reindexed = False
+            return True
+        now = time.monotonic()
+        if now - self.checked_at < self.check_interval:
+            return False
+        self.checked_at = now
+        try:
+            mtime = os.path.getmtime(self.path)
+        except OSError:
+            mtime = None
+        if mtime == self.mtime:
+            return False
+        self.load()
+        return True
+
+    def keys(self):
+        return list(self.offsets)
+
+    def __contains__(self, key):
+        return key in self.offsets
+
+    def __getitem__(self, key):
+        try:
+            return self._read(key)
+        except (OSError, ValueError):
+            # Truncated or rewritten since it was indexed: reindex and retry once
+            self.load()
+            self.reindexed = True
+            return self._read(key)
+
+    def _read(self, key):
+        with self.lock:
+            start, end = self.offsets[key]
+            fd = self.file.fileno()
+            if os.fstat(fd).st_mtime != self.mtime:
+                raise ValueError(f"{self.path} was rewritten in place")
+            data = os.pread(fd, end - start, start)
+        if len(data) != end - start:
+            raise ValueError(f"short read from {self.path}")
+        return json.loads(data.decode('utf-8'))
+
+    def __len__(self):
+        return len(self.offsets)
+
+snippet_index = SnippetIndex('programs.json', check_interval=float(os.environ.get('SNIPPET_RELOAD_SECONDS', 1)))
+
+# --- Caching ---
+class LRUCache:
+    """Thread-safe LRU cache with an optional time-to-live (in seconds).
+
+    With a shared tier (a SqliteCache), misses fall through to it and new
+    entries are written to it, so worker processes reuse each other's results.
+    """
+
+    def __init__(self, maxsize=256, ttl=None, shared=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.shared = shared
+        self.data = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.shared_hits = 0
+
+    def get(self, key, default=None):
+        with self.lock:
+            entry = self.data.get(key)
+            if entry is not None:
+                value, expires = entry
+                if expires is None or expires > time.monotonic():
+                    self.data.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self.data[key]
+            self.misses += 1
+        if self.shared is not None:
+            value = self.shared.get(key)
+            if value is not None:
+                self.shared_hits += 1
+                self._remember(key, value)
+                return value
+        return default
+
+    def set(self, key, value, ttl=None):
+        """Store value; ttl overrides the cache's time-to-live for this entry"""
+        if self.maxsize <= 0:
+            return
+        self._remember(key, value, ttl)
+        if self.shared is not None:
+            self.shared.set(key, value)
+
+    def _remember(self, key, value, ttl=None):
+        ttl = self.ttl if ttl is None else ttl
+        expires = time.monotonic() + ttl if ttl else None
+        with self.lock:
+            self.data[key] = (value, expires)
+            self.data.move_to_end(key)
+            while len(self.data) > self.maxsize:
+                self.data.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.data.clear()
+
+    def __len__(self):
+        return len(self.data)
+
+class SqliteCache:
+    """Key/value table in a SQLite file, shared by every worker process on the host.
+
+    Keys and values are stored as JSON, so tuples come back as lists. SQLite
+    connections must not cross a fork, so forked children open their own.
+    Every `purge_every` writes, expired rows are deleted and the table is cut
+    back to the `max_rows` most recently written.
+    """
+
+    def __init__(self, path, name, ttl=None, max_rows=10000, purge_every=256):
+        self.path = path
+        self.table = f"cache_{name}"
+        self.ttl = ttl
+        self.max_rows = max_rows
+        self.purge_every = purge_every
+        self.writes = 0
+        self._connect()
+        os.register_at_fork(after_in_child=self._connect)
+
+    def _connect(self):
+        import sqlite3
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None, timeout=5)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(f"CREATE TABLE IF NOT EXISTS {self.table} (key TEXT PRIMARY KEY, value TEXT, expires REAL)")
+
+    def get(self, key):
+        with self.lock:
+            row = self.conn.execute(f"SELECT value, expires FROM {self.table} WHERE key = ?", (json.dumps(key),)).fetchone()
+        if row is None or (row[1] is not None and row[1] <= time.time()):
+            return None
+        return json.loads(row[0])
+
+    def set(self, key, value):
+        now = time.time()
+        expires = now + self.ttl if self.ttl else None
+        with self.lock:
+            self.conn.execute(f"INSERT OR REPLACE INTO {self.table} (key, value, expires) VALUES (?, ?, ?)",
+                              (json.dumps(key), json.dumps(value), expires))
+            self.writes += 1
+            if self.writes >= self.purge_every:
+                self.writes = 0
+                self._purge(now)
+
+    def _purge(self, now):
+        self.conn.execute(f"DELETE FROM {self.table} WHERE expires <= ?", (now,))
+        if self.max_rows:
+            # REPLACE gives a rewritten row a new rowid, so rowid order is write order
+            self.conn.execute(f"DELETE FROM {self.table} WHERE rowid <= (SELECT rowid FROM {self.table} "
+                              f"ORDER BY rowid DESC LIMIT 1 OFFSET ?)", (self.max_rows,))
+
+# Set SHARED_CACHE_PATH to let worker processes share captions, Wikipedia articles, math results and upload jobs
+SHARED_CACHE_PATH = os.environ.get('SHARED_CACHE_PATH')
+SHARED_CACHE_MAX_ROWS = int(os.environ.get('SHARED_CACHE_MAX_ROWS', 10000))
+
+def shared_cache(name, ttl=None, path=None):
+    path = path or SHARED_CACHE_PATH
+    return SqliteCache(path, name, ttl, max_rows=SHARED_CACHE_MAX_ROWS) if path else None
+
+# --- Metrics ---
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+class LatencyMetrics:
+    """Call counts, error counts and latency histograms, rendered in Prometheus text format"""
+
+    # metric -> label name on the exported series
+    LABELS = {"intent": "intent", "upload": "type", "backend": "backend"}
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.series = {}  # (metric, name) -> [calls, errors, seconds, per-bucket counts]
+        self.lock = threading.Lock()
+
+    def observe(self, metric, name, seconds, error=False):
+        index = bisect.bisect_left(self.buckets, seconds)
+        with self.lock:
+            series = self.series.get((metric, name))
+            if series is None:
+                series = self.series[(metric, name)] = [0, 0, 0.0, [0] * (len(self.buckets) + 1)]
+            series[0] += 1
+            series[1] += error
+            series[2] += seconds
+            series[3][index] += 1
+
+    @contextmanager
+    def timer(self, metric, name):
+        """Time the body of a with block; an exception counts as an error"""
+        start = time.perf_counter()
+        error = True
+        try:
+            yield
+            error = False
+        finally:
+            self.observe(metric, name, time.perf_counter() - start, error)
+
+    def render(self):
+        with self.lock:
+            series = {key: (calls, errors, seconds, list(counts)) for key, (calls, errors, seconds, counts) in self.series.items()}
+        lines = []
+        for metric, label in self.LABELS.items():
+            rows = sorted((name, values) for (m, name), values in series.items() if m == metric)
+            if not rows:
+                continue
+            lines.append(f"# HELP assistant_{metric}_seconds Latency of {metric} handlers")
+            lines.append(f"# TYPE assistant_{metric}_seconds histogram")
+            for name, (calls, _, seconds, counts) in rows:
+                cumulative = 0
+                for bound, count in zip(self.buckets, counts):
+                    cumulative += count
+                    lines.append(f'assistant_{metric}_seconds_bucket{{{label}="{name}",le="{bound}"}} {cumulative}')
+                lines.append(f'assistant_{metric}_seconds_bucket{{{label}="{name}",le="+Inf"}} {calls}')
+                lines.append(f'assistant_{metric}_seconds_sum{{{label}="{name}"}} {seconds:.6f}')
+                lines.append(f'assistant_{metric}_seconds_count{{{label}="{name}"}} {calls}')
+            lines.append(f"# HELP assistant_{metric}_errors_total Failed {metric} calls")
+            lines.append(f"# TYPE assistant_{metric}_errors_total counter")
+            for name, (_, errors, _, _) in rows:
+                lines.append(f'assistant_{metric}_errors_total{{{label}="{name}"}} {errors}')
+        return "\n".join(lines) + "\n"
+
+metrics = LatencyMetrics()
+
+# --- Image Captioning Setup (lazy loading) ---
+processor = None
+model = None
+
+def load_image_models():
+    """Lazy load the image captioning models only when needed"""
+    global processor, model
+    if processor is None or model is None:
+        try:
+            from transformers import BlipProcessor, BlipForConditionalGeneration
+            print("Loading BLIP models... This may take a while.")
+            processor = BlipProcessor.from_pretrained("Salesforce/blip-image-captioning-base")
+            model = BlipForConditionalGeneration.from_pretrained("Salesforce/blip-image-captioning-base")
+            # Inference only: no autograd state, and pages shared after a fork stay untouched
+            model.eval()
+            model.requires_grad_(False)
+            print("Models loaded successfully!")
+        except Exception as e:
+            print(f"Error loading models: {e}")
+            raise
+    return processor, model
+
+class CaptionEngine:
+    """Runs BLIP on a dedicated thread, captioning queued images in micro-batches.
+
+    Requests wait at most max_wait_ms for others to join their batch. Only the
+    inference thread touches the model, so concurrent uploads are safe.
+    """
+
+    def __init__(self, loader, max_batch=8, max_wait_ms=20, threads=0):
+        self.loader = loader
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000
+        self.threads = threads
+        self.requests = queue.Queue()
+        self.lock = threading.Lock()
+        self.thread = None
+        self.models = None
+        self.batches = 0
+        self.images = 0
+
+    def start(self):
+        """Start the inference thread, which loads the models straight away"""
+        with self.lock:
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._run, name="caption-engine", daemon=True)
+                self.thread.start()
+
+    def submit(self, image):
+        from concurrent.futures import Future
+        self.start()
+        future = Future()
+        self.requests.put((image, future))
+        return future
+
+    def caption(self, image, timeout=None):
+        return self.submit(image).result(timeout)
+
+    def preload(self):
+        """Load the models without starting the inference thread, e.g. in a pre-fork master"""
+        self._load()
+
+    def _load(self):
+        if self.models is None:
+            self.models = self.loader()
+        return self.models
+
+    def _next_batch(self):
+        batch = [self.requests.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self.requests.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        # Set here rather than at load time: torch's thread pool must not be created before a fork
+        if self.threads:
+            import torch
+            torch.set_num_threads(self.threads)
+        try:
+            self._load()
+        except Exception:
+            pass  # retried, and reported, on the first batch
+        while True:
+            batch = self._next_batch()
+            try:
+                with metrics.timer("backend", "blip"):
+                    captions = self._caption_batch([image for image, _ in batch])
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            for (_, future), caption in zip(batch, captions):
+                future.set_result(caption)
+
+    def _caption_batch(self, images):
+        import torch
+        batch_processor, batch_model = self._load()
+        with torch.inference_mode():
+            inputs = batch_processor(images=images, return_tensors="pt")
+            out = batch_model.generate(**inputs)
+        self.batches += 1
+        self.images += len(images)
+        return batch_processor.batch_decode(out, skip_special_tokens=True)
+
+    def stats(self):
+        return {
+            "batches": self.batches,
+            "images": self.images,
+            "queued": self.requests.qsize(),
+            "loaded": self.models is not None,
+        }
+
+class FixtureCaptionEngine(CaptionEngine):
+    """Names each image's average colour after a fixed delay per batch, for tests and offline runs"""
+
+    def __init__(self, delay_ms=50, **kwargs):
+        super().__init__(loader=lambda: None, **kwargs)
+        self.delay = delay_ms / 1000
+
+    def _load(self):
+        return None
+
+    def _caption_batch(self, images):
+        time.sleep(self.delay)
+        self.batches += 1
+        self.images += len(images)
+        captions = []
+        for image in images:
+            red, green, blue = image.convert("RGB").resize((1, 1)).getpixel((0, 0))
+            captions.append(f"a picture that is mostly rgb({red}, {green}, {blue})")
+        return captions
+
+def create_caption_engine():
+    options = dict(
+        max_batch=int(os.environ.get('CAPTION_MAX_BATCH', 8)),
+        max_wait_ms=float(os.environ.get('CAPTION_MAX_WAIT_MS', 20)),
+    )
+    if os.environ.get('CAPTION_BACKEND', 'blip') == 'fixture':
+        return FixtureCaptionEngine(delay_ms=float(os.environ.get('CAPTION_FIXTURE_MS', 50)), **options)
+    return CaptionEngine(load_image_models, threads=int(os.environ.get('CAPTION_THREADS', 0)), **options)
+
+CAPTION_WARMUP = os.environ.get('CAPTION_WARMUP', '0') == '1'
+CAPTION_TIMEOUT = float(os.environ.get('CAPTION_TIMEOUT', 120))
+caption_engine = create_caption_engine()
+
+# Captions keyed by a hash of the image bytes; CAPTION_CACHE_PATH keeps them in their own SQLite file
+caption_cache = LRUCache(
+    maxsize=int(os.environ.get('CAPTION_CACHE_SIZE', 1024)),
+    shared=shared_cache("captions", path=os.environ.get('CAPTION_CACHE_PATH')),
+)
+
+# BLIP resizes its input to 384x384, so there is no point decoding more pixels than that
+CAPTION_IMAGE_SIZE = 384
+
+def decode_image(data):
+    """Open image bytes, decoding large photos at reduced size"""
+    from PIL import Image
+    import io
+    img = Image.open(io.BytesIO(data))
+    width, height = img.size
+    scale = CAPTION_IMAGE_SIZE / min(width, height)
+    if scale < 1:
+        target = (max(1, round(width * scale)), max(1, round(height * scale)))
+        # draft() lets the JPEG decoder skip detail directly; thumbnail() finishes the resize
+        img.draft("RGB", target)
+        img.thumbnail(target)
+    return img.convert("RGB")
+
+def caption_image_bytes(data):
+    """Caption an uploaded image, reusing the caption of identical uploads"""
+    import hashlib
+    digest = hashlib.sha256(data).hexdigest()
+    caption = caption_cache.get(digest)
+    if caption is not None:
+        return caption
+    try:
+        caption = caption_engine.caption(decode_image(data), timeout=CAPTION_TIMEOUT)
+    except Exception as e:
+        return f"Error generating caption: {str(e)}"
+    caption_cache.set(digest, caption)
+    return caption
+
+# --- Document Summarization ---
+SUMMARY_SENTENCES = int(os.environ.get('SUMMARY_SENTENCES', 5))
+SUMMARY_CHUNK_SENTENCES = int(os.environ.get('SUMMARY_CHUNK_SENTENCES', 5000))
+# How long "summarize" waits for a PDF that is still being extracted
+SUMMARY_LOADING_WAIT = float(os.environ.get('SUMMARY_LOADING_WAIT', 5))
+# Document hash -> summary, so asking twice (or re-uploading) doesn't rescore
+summary_cache = LRUCache(maxsize=int(os.environ.get('SUMMARY_CACHE_SIZE', 64)), ttl=3600)
+
+SENTENCE = re.compile(r'[^.!?]+')
+WORD = re.compile(r"[a-z0-9']+")
+STOP_WORDS = frozenset("""
+a about after all also an and any are as at be been but by can could did do does for from had has
+have he her his how i if in into is it its just may more most no not of on one or other our out she
+so some such than that the their them then there these they this those to too up was we were what
+when which who will with would you your
+""".split())
+
+def iter_sentence_chunks(text, chunk_size):
+    """Yield lists of sentences (longer than 20 characters), chunk_size at a time"""
+    chunk = []
+    for match in SENTENCE.finditer(text):
+        sentence = " ".join(match.group().split())
+        if len(sentence) > 20:
+            chunk.append(sentence)
+            if len(chunk) == chunk_size:
+                yield chunk
+                chunk = []
+    if chunk:
+        yield chunk
+
+def sentence_terms(sentences, vocabulary, grow=True):
+    """Sentence-term matrix of a chunk in COO form: (row, term id, count) arrays"""
+    import numpy as np
+    rows, terms = [], []
+    for row, sentence in enumerate(sentences):
+        for word in WORD.findall(sentence.lower()):
+            if word in STOP_WORDS or len(word) < 2:
+                continue
+            term = vocabulary.get(word)
+            if term is None:
+                if not grow:
+                    continue
+                term = vocabulary[word] = len(vocabulary)
+            rows.append(row)
+            terms.append(term)
+    if not rows:
+        empty = np.zeros(0, dtype=np.int64)
+        return empty, empty, empty
+    # Collapse repeated (row, term) pairs into counts
+    pairs, counts = np.unique(np.array(rows, dtype=np.int64) * len(vocabulary) + np.array(terms, dtype=np.int64),
+                              return_counts=True)
+    return pairs // len(vocabulary), pairs % len(vocabulary), counts
+
+def rank_sentences(text, max_sentences, chunk_size=SUMMARY_CHUNK_SENTENCES):
+    """Centroid TF-IDF ranking: returns the best (index, sentence) pairs in document order.
+
+    The text is read in chunks of sentences twice: once for document
+    frequencies, once to score each sentence against the document centroid.
+    Only one chunk's matrix and the top max_sentences are held at a time.
+    """
+    import numpy as np
+    vocabulary = {}
+    doc_freq = np.zeros(0)
+    term_freq = np.zeros(0)
+    total = 0
+    for chunk in iter_sentence_chunks(text, chunk_size):
+        _, terms, counts = sentence_terms(chunk, vocabulary)
+        doc_freq = np.pad(doc_freq, (0, len(vocabulary) - len(doc_freq)))
+        term_freq = np.pad(term_freq, (0, len(vocabulary) - len(term_freq)))
+        np.add.at(doc_freq, terms, 1)
+        np.add.at(term_freq, terms, counts)
+        total += len(chunk)
+    if total <= max_sentences:
+        return list(enumerate(s for chunk in iter_sentence_chunks(text, chunk_size) for s in chunk))
+
+    idf = np.log((1 + total) / (1 + doc_freq)) + 1
+    centroid = term_freq * idf
+
+    best = []  # (score, index, sentence)
+    offset = 0
+    for chunk in iter_sentence_chunks(text, chunk_size):
+        rows, terms, counts = sentence_terms(chunk, vocabulary, grow=False)
+        weights = (1 + np.log(counts)) * idf[terms]
+        dot = np.bincount(rows, weights * centroid[terms], minlength=len(chunk))
+        norm = np.sqrt(np.bincount(rows, weights * weights, minlength=len(chunk)))
+        scores = np.divide(dot, norm, out=np.zeros(len(chunk)), where=norm > 0)
+        top = np.argsort(-scores, kind="stable")[:max_sentences]
+        best.extend((scores[i], offset + i, chunk[i]) for i in top)
+        best = sorted(best, key=lambda item: (-item[0], item[1]))[:max_sentences]
+        offset += len(chunk)
+    return sorted((index, sentence) for _, index, sentence in best)
+
+def top_terms(text, count=5):
+    """Most frequent content words, used as the document's key terms"""
+    from collections import Counter
+    words = (w for w in WORD.findall(text.lower()) if w not in STOP_WORDS and len(w) > 3)
+    return [word for word, _ in Counter(words).most_common(count)]
+
+def summarize_text(text, max_sentences=SUMMARY_SENTENCES):
+    """Extract main points from text"""
+    try:
+        import hashlib
+        key = (hashlib.sha256(text.encode("utf-8", "replace")).hexdigest(), max_sentences)
+        result = summary_cache.get(key)
+        if result is not None:
+            return result
+
+        selected = rank_sentences(text, max_sentences)
+        summary = ". ".join(sentence for _, sentence in selected) + "."
+        result = "📄 **Summary:**\n\n" + summary
+
+        terms = top_terms(text)
+        if terms:
+            result += "\n\n**Key Terms:** " + ", ".join(terms)
+
+        summary_cache.set(key, result)
+        return result
+    except Exception as e:
+        return f"Error summarizing text: {str(e)}"
+
+# --- Story Generation --- 
+def generate_story(key_points):
+    story_templates = [
+        "Once upon a time, there was a {character} who was {adjective}. One day, they discovered {discovery}. This discovery led them on a journey to {destination}, where they encountered {obstacle}. With determination and courage, they overcame the obstacle and {resolution}.",
+        "In a distant land, a {character} set out on an adventure to {goal}. Along the way, they faced many challenges, including {challenge}. But through wisdom and bravery, they succeeded in {achievement}. Their journey became a legend, known far and wide as the {story_name}.",
+        "A {adjective} {character} found themselves caught in an unexpected situation. While trying to {action}, they stumbled upon {discovery}. This started a chain of events that led to {unexpected_turn}. In the end, they learned {lesson}, and their life was changed forever."
+    ]
+
+    story_data = {
+        "character": "knight" if "knight" in str(key_points) else "hero",
+        "adjective": "brave" if "brave" in str(key_points) else "kind",
+        "discovery": "a hidden treasure" if "treasure" in str(key_points) else "a powerful artifact",
+        "destination": "a distant castle" if "castle" in str(key_points) else "an enchanted forest",
+        "obstacle": "a dangerous dragon" if "dragon" in str(key_points) else "an evil sorcerer",
+        "resolution": "became a legend" if "legend" in str(key_points) else "defeated the dark forces",
+        "goal": "defeat the evil forces" if "evil" in str(key_points) else "find a rare artifact",
+        "challenge": "treacherous terrain" if "terrain" in str(key_points) else "a fierce monster",
+        "achievement": "saving the kingdom" if "kingdom" in str(key_points) else "finding the treasure",
+        "story_name": "The Brave Knight's Quest" if "knight" in str(key_points) else "The Hero's Journey",
+        "action": "fight the sorcerer" if "fight" in str(key_points) else "seek the hidden treasure",
+        "unexpected_turn": "they realized the treasure was cursed" if "cursed" in str(key_points) else "they were betrayed by an ally",
+        "lesson": "the true meaning of courage" if "courage" in str(key_points) else "the importance of friendship"
+    }
+
+    story_template = random.choice(story_templates)
+    story = story_template.format(**story_data)
+    return story
+
+# --- Basic Math Expression Evaluation ---
+# Limits that keep a single message from pinning the CPU
+MAX_NUMBER_DIGITS = 1000
+MAX_EXPONENT = 10000
+
+ARITHMETIC_TOKEN = re.compile(r"\s*(?:(\d+\.?\d*|\.\d+)|(\*\*|//|[-+*/%()]))")
+
+class MathLimitError(ValueError):
+    pass
+
+def tokenize_arithmetic(expression):
+    """Split an arithmetic expression into numbers and operators, or return None"""
+    tokens = []
+    pos = 0
+    expression = expression.rstrip()
+    while pos < len(expression):
+        match = ARITHMETIC_TOKEN.match(expression, pos)
+        if not match:
+            return None
+        number, operator = match.groups()
+        if number is not None:
+            if len(number) > MAX_NUMBER_DIGITS:
+                raise MathLimitError("number too long")
+            tokens.append(float(number) if "." in number else int(number))
+        else:
+            tokens.append(operator)
+        pos = match.end()
+    return tokens
+
+def check_size(value):
+    if isinstance(value, int) and value.bit_length() > MAX_NUMBER_DIGITS * 4:
+        raise MathLimitError("result too large")
+    return value
+
+def safe_power(base, exponent):
+    if abs(exponent) > MAX_EXPONENT:
+        raise MathLimitError("exponent too large")
+    if isinstance(base, int) and isinstance(exponent, int) and abs(base) > 1 and exponent > 0:
+        # Estimate the result size before computing it
+        if base.bit_length() * exponent > MAX_NUMBER_DIGITS * 4:
+            raise MathLimitError("result too large")
+    return base ** exponent
+
+BINARY_OPERATORS = {
+    "+": lambda a, b: a + b,
+    "-": lambda a, b: a - b,
+    "*": lambda a, b: a * b,
+    "/": lambda a, b: a / b,
+    "//": lambda a, b: a // b,
+    "%": lambda a, b: a % b,
+}
+
+class ArithmeticParser:
+    """Recursive-descent evaluator for + - * / // % ** and parentheses.
+
+    Follows Python's precedence rules so results match the old eval() path:
+    ** binds tighter than unary minus on its left and is right-associative.
+    """
+
+    def __init__(self, tokens):
+        self.tokens = tokens
+        self.pos = 0
+
+    def peek(self):
+        return self.tokens[self.pos] if self.pos < len(self.tokens) else None
+
+    def take(self):
+        token = self.peek()
+        self.pos += 1
+        return token
+
+    def parse(self):
+        value = self.expr()
+        if self.pos != len(self.tokens):
+            raise SyntaxError("unexpected token")
+        return value
+
+    def expr(self):
+        value = self.term()
+        while self.peek() in ("+", "-"):
+            value = check_size(BINARY_OPERATORS[self.take()](value, self.term()))
+        return value
+
+    def term(self):
+        value = self.factor()
+        while self.peek() in ("*", "/", "//", "%"):
+            value = check_size(BINARY_OPERATORS[self.take()](value, self.factor()))
+        return value
+
+    def factor(self):
+        if self.peek() in ("+", "-"):
+            sign = self.take()
+            value = self.factor()
+            return -value if sign == "-" else +value
+        return self.power()
+
+    def power(self):
+        base = self.atom()
+        if self.peek() == "**":
+            self.take()
+            return check_size(safe_power(base, self.factor()))
+        return base
+
+    def atom(self):
+        token = self.take()
+        if token == "(":
+            value = self.expr()
+            if self.take() != ")":
+                raise SyntaxError("missing closing bracket")
+            return value
+        if isinstance(token, (int, float)):
+            return token
+        raise SyntaxError("expected a number")
+
+arithmetic_cache = LRUCache(1024)
+
+def evaluate_arithmetic(expression):
+    """Evaluate plain arithmetic without eval(); returns None if it isn't arithmetic"""
+    key = expression.strip()
+    result = arithmetic_cache.get(key)
+    if result is None:
+        tokens = tokenize_arithmetic(key)
+        if not tokens:
+            return None
+        result = ArithmeticParser(tokens).parse()
+        arithmetic_cache.set(key, result)
+    return result
+
+def evaluate_math_expression(expression):
+    try:
+        expression = expression.lower()
+        expression = expression.replace("plus", "+").replace("minus", "-")
+        expression = expression.replace("x", "*").replace("into", "*")
+        expression = expression.replace("divided by", "/").replace("mod", "%")
+        result = evaluate_arithmetic(expression)
+        if result is None:
+            return None
+        return f"The answer is: {result}"
+    except MathLimitError:
+        return "Sorry, that number is too large for me to calculate."
+    except Exception:
+        return None
+
+# --- Advanced Math Solver ---
+class SympyWorkerPool:
+    """Bounded pool of pre-warmed SymPy worker processes.
+
+    Each job gets a hard wall-clock timeout; a worker that overruns it is
+    killed and replaced. Results are cached by (operation, expression) so
+    repeated queries never reach a worker.
+    """
+
+    def __init__(self, size, queue_depth, timeout, cache_size, shared=None):
+        self.size = size
+        self.timeout = timeout
+        self.cache = LRUCache(cache_size, shared=shared)
+        # Jobs running plus jobs waiting for a worker
+        self.slots = threading.BoundedSemaphore(size + queue_depth)
+        self.idle = queue.Queue()
+        self.lock = threading.Lock()
+        self.started = False
+        self.timeouts = 0
+        self.rejected = 0
+
+    def start(self):
+        with self.lock:
+            if self.started or self.size <= 0:
+                return
+            for _ in range(self.size):
+                self.idle.put(self._spawn())
+            self.started = True
+
+    def _spawn(self):
+        import multiprocessing
+        import sympy_worker
+        ctx = multiprocessing.get_context("spawn")
+        parent_conn, child_conn = ctx.Pipe()
+        process = ctx.Process(target=sympy_worker.worker_loop, args=(child_conn,), daemon=True)
+        process.start()
+        child_conn.close()
+        return {"process": process, "conn": parent_conn, "ready": False}
+
+    def _kill(self, worker):
+        worker["process"].kill()
+        worker["process"].join()
+        worker["conn"].close()
+
+    def _run(self, worker, operation, expression):
+        conn = worker["conn"]
+        if not worker["ready"]:
+            # A fresh worker reports in once SymPy is imported; startup is not billed to the job
+            if not conn.poll(SYMPY_STARTUP_TIMEOUT):
+                raise TimeoutError("worker failed to start")
+            conn.recv()
+            worker["ready"] = True
+        conn.send((operation, expression))
+        if not conn.poll(self.timeout):
+            raise TimeoutError(f"no result after {self.timeout}s")
+        return conn.recv()
+
+    def solve(self, operation, expression):
+        key = (operation, expression)
+        result = self.cache.get(key)
+        if result is not None:
+            return result
+
+        if self.size <= 0:
+            # Pool disabled: solve inline on the request thread
+            import sympy_worker
+            with metrics.timer("backend", "sympy"):
+                result = sympy_worker.run_job(operation, expression)
+            self.cache.set(key, result)
+            return result
+
+        if not self.slots.acquire(blocking=False):
+            self.rejected += 1
+            return "Sorry, the math solver is busy right now. Please try again."
+        try:
+            self.start()
+            # Holding a slot bounds the wait: at most queue_depth jobs are
+            # ahead of this one, and the timeout only covers solving
+            worker = self.idle.get()
+            try:
+                with metrics.timer("backend", "sympy"):
+                    result = self._run(worker, operation, expression)
+            except (TimeoutError, EOFError, OSError) as e:
+                print(f"SymPy worker restarted: {e}")
+                self.timeouts += 1
+                self._kill(worker)
+                self.idle.put(self._spawn())
+                return "Sorry, that problem took too long to solve."
+            self.idle.put(worker)
+            self.cache.set(key, result)
+            return result
+        finally:
+            self.slots.release()
+
+    def stats(self):
+        return {
+            "workers": self.size,
+            "cache_hits": self.cache.hits,
+            "cache_misses": self.cache.misses,
+            "shared_hits": self.cache.shared_hits,
+            "timeouts": self.timeouts,
+            "rejected": self.rejected,
+        }
+
+SYMPY_STARTUP_TIMEOUT = 60
+sympy_pool = SympyWorkerPool(
+    size=int(os.environ.get('SYMPY_POOL_SIZE', 2)),
+    queue_depth=int(os.environ.get('SYMPY_QUEUE_DEPTH', 16)),
+    timeout=float(os.environ.get('SYMPY_TIMEOUT', 10)),
+    cache_size=int(os.environ.get('SYMPY_CACHE_SIZE', 512)),
+    shared=shared_cache("sympy"),
+)
+
+def advanced_math_solver(expression):
+    expression = expression.lower().replace("^", "**")
+
+    if "solve" in expression:
+        operation, expr = "solve", expression.replace("solve", "")
+    elif "differentiate" in expression or "derivative" in expression:
+        operation, expr = "differentiate", expression.replace("differentiate", "").replace("derivative", "")
+    elif "integrate" in expression:
+        operation, expr = "integrate", expression.replace("integrate", "")
+    elif "simplify" in expression:
+        operation, expr = "simplify", expression.replace("simplify", "")
+    elif "limit" in expression:
+        operation, expr = "limit", expression.replace("limit", "")
+    else:
+        return None
+
+    # Collapse whitespace so trivially different queries share a cache entry
+    expr = " ".join(expr.split())
+    return sympy_pool.solve(operation, expr)
+
+# --- Disease Info Handler ---
+DISEASE_DATA_PATH = os.environ.get('DISEASE_DATA_PATH', 'diseases.json')
+DISEASE_MAX_RESULTS = int(os.environ.get('DISEASE_MAX_RESULTS', 3))
+
+class DiseaseIndex:
+    """Inverted index over the conditions in diseases.json.
+
+    Names, aliases and symptom phrases are split into words and keyed by the
+    whole phrase, so a message is matched by looking up its word n-grams: only
+    whole words match ("cold" is not found in "scold") and the cost depends on
+    the message, not on how many conditions are loaded.
+    """
+
+    TOKEN = re.compile(r"[a-z0-9]+(?:[-'][a-z0-9]+)*")
+    NAME_WEIGHT = 3
+
+    def __init__(self, path):
+        self.path = path
+        self.conditions = {}  # id -> entry as stored in the file
+        self.names = {}       # phrase -> ids whose name or alias it is
+        self.symptoms = {}    # phrase -> ids that list it as a symptom
+        self.labels = {}      # phrase -> symptom text for replies
+        self.weights = {}     # phrase -> score for matching that symptom
+        self.max_words = 1
+        self.load()
+
+    @classmethod
+    def words(cls, text):
+        """Lowercased words with a plural "s" dropped, so "aches" finds "ache"."""
+        return [w[:-1] if len(w) > 3 and w.endswith("s") and not w.endswith("ss") else w
+                for w in cls.TOKEN.findall(text.lower())]
+
+    def load(self):
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                entries = json.load(f)
+        except FileNotFoundError:
+            print(f"Warning: {self.path} not found. No disease info available.")
+            entries = []
+        except Exception as e:
+            print(f"Error loading {self.path}: {e}")
+            entries = []
+
+        conditions, names, symptoms, labels, max_words = {}, {}, {}, {}, 1
+        for entry in entries:
+            if "id" not in entry or "name" not in entry:
+                print(f"Warning: skipping disease entry without an id or name: {entry}")
+                continue
+            conditions[entry["id"]] = entry
+            for alias in [entry["name"], entry["id"]] + entry.get("aliases", []):
+                phrase = self.words(alias)
+                if phrase:
+                    names.setdefault(" ".join(phrase), set()).add(entry["id"])
+                    max_words = max(max_words, len(phrase))
+            for term in entry.get("symptom_terms", []):
+                phrase = self.words(term)
+                if phrase:
+                    key = " ".join(phrase)
+                    symptoms.setdefault(key, set()).add(entry["id"])
+                    labels.setdefault(key, term)
+                    max_words = max(max_words, len(phrase))
+        # Rarer symptoms say more about which condition it is
+        import math
+        self.weights = {phrase: 1 + math.log(len(conditions) / len(keys)) for phrase, keys in symptoms.items()}
+        self.conditions, self.names, self.symptoms = conditions, names, symptoms
+        self.labels, self.max_words = labels, max_words
+
+    def __len__(self):
+        return len(self.conditions)
+
+    def trigger_words(self):
+        """First word of every indexed phrase, for the intent router's pre-filter"""
+        return sorted({phrase.split(" ", 1)[0] for phrase in list(self.names) + list(self.symptoms)})
+
+    def phrases(self, message):
+        """Every run of up to max_words consecutive words in the message"""
+        words = self.words(message)
+        for i in range(len(words)):
+            for n in range(1, min(self.max_words, len(words) - i) + 1):
+                yield " ".join(words[i:i + n])
+
+    def lookup(self, message, limit=None):
+        """Conditions matching the message, best first.
+
+        Each result is {"info", "score", "named", "symptoms"}. Naming a
+        condition scores NAME_WEIGHT per word of the name; each symptom scores
+        more the fewer conditions share it. Only the top `limit` results are
+        built, so common symptoms shared by many conditions stay cheap.
+        """
+        import heapq
+        scores, named, described = {}, set(), []
+        for phrase in dict.fromkeys(self.phrases(message)):
+            keys = self.names.get(phrase)
+            if keys:
+                weight = self.NAME_WEIGHT * (phrase.count(" ") + 1)
+                for key in keys:
+                    scores[key] = scores.get(key, 0) + weight
+                named.update(keys)
+            keys = self.symptoms.get(phrase)
+            if keys:
+                described.append(phrase)
+                weight = self.weights[phrase]
+                for key in keys:
+                    scores[key] = scores.get(key, 0) + weight
+
+        rank = lambda key: (-scores[key], self.conditions[key]["name"])
+        best = heapq.nsmallest(limit, scores, key=rank) if limit else sorted(scores, key=rank)
+        return [{
+            "info": self.conditions[key],
+            "score": round(scores[key], 3),
+            "named": key in named,
+            "symptoms": [self.labels[p] for p in described if key in self.symptoms[p]],
+        } for key in best]
+
+disease_index = DiseaseIndex(DISEASE_DATA_PATH)
+
+def format_disease_info(info):
+    return (
+        f"🩺 *{info['name']}*\n"
+        f"- **Symptoms**: {info['symptoms']}\n"
+        f"- **Cause**: {info['cause']}\n"
+        f"- **Treatment**: {info['treatment']}\n"
+        f"- **Severity**: {info['severity']}"
+    )
+
+def format_symptom_matches(results):
+    lines = ["🩺 Conditions that match your symptoms:"]
+    for rank, result in enumerate(results, 1):
+        info = result["info"]
+        lines.append(f"{rank}. **{info['name']}** ({', '.join(result['symptoms']) or 'named'}) - {info['severity']}")
+    lines.append("Ask about any of them for details, and see a doctor if symptoms persist.")
+    return "\n".join(lines)
+
+def get_disease_info(message):
+    """Details of the conditions the message names, or a ranked list when it describes symptoms"""
+    results = disease_index.lookup(message, limit=DISEASE_MAX_RESULTS)
+    if not results:
+        return None
+    named = [r for r in results if r["named"]]
+    described = {s for r in results for s in r["symptoms"]}
+    # "I have a cold" asks about one condition; "fever and chills" describes symptoms
+    if named and len(described) < 2:
+        return "\n\n".join(format_disease_info(r["info"]) for r in named)
+    return format_symptom_matches(results)
+
+# --- Program Snippet Handler ---
+def format_program_snippet(key):
+    return f"Here is the {key} program:\n```python\n{snippet_index[key]}\n```"
+
+# --- Wikipedia Info ---
+class LiveWikipediaBackend:
+    """Fetches article text from the MediaWiki API over a pooled HTTP session"""
+
+    def __init__(self, api_url="https://en.wikipedia.org/w/api.php", timeout=5, pool_size=10):
+        import requests
+        from requests.adapters import HTTPAdapter
+        self.api_url = api_url
+        self.timeout = timeout
+        self.session = requests.Session()
+        self.session.mount("https://", HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size))
+        self.session.headers["User-Agent"] = "VirtualAssistant/1.0"
+
+    def _query(self, **params):
+        params.update(action="query", format="json")
+        response = self.session.get(self.api_url, params=params, timeout=self.timeout)
+        response.raise_for_status()
+        return response.json()["query"]
+
+    def fetch(self, topic):
+        # Same lookup as wikipedia.summary(): best search hit, else the spelling suggestion
+        search = self._query(list="search", srsearch=topic, srlimit=1, srinfo="suggestion", srprop="")
+        if search["search"]:
+            title = search["search"][0]["title"]
+        elif search.get("searchinfo", {}).get("suggestion"):
+            title = search["searchinfo"]["suggestion"]
+        else:
+            raise LookupError(f'"{topic}" does not match any pages. Try another query!')
+        pages = self._query(prop="extracts", explaintext=1, redirects=1, titles=title)["pages"]
+        return next(iter(pages.values())).get("extract", "")
+
+class FixtureWikipediaBackend:
+    """Serves articles from a local JSON file of {topic: text}, for tests and offline runs"""
+
+    def __init__(self, path):
+        with open(path) as f:
+            self.articles = {topic.lower(): text for topic, text in json.load(f).items()}
+
+    def fetch(self, topic):
+        if topic.lower() not in self.articles:
+            raise LookupError(f'"{topic}" does not match any pages. Try another query!')
+        return self.articles[topic.lower()]
+
+def create_wikipedia_backend():
+    if os.environ.get('WIKIPEDIA_BACKEND', 'live') == 'fixture':
+        return FixtureWikipediaBackend(os.environ.get('WIKIPEDIA_FIXTURES', 'wikipedia_fixtures.json'))
+    return LiveWikipediaBackend(
+        api_url=os.environ.get('WIKIPEDIA_API_URL', "https://en.wikipedia.org/w/api.php"),
+        timeout=float(os.environ.get('WIKIPEDIA_TIMEOUT', 5)),
+    )
+
+wikipedia_backend = None
+# Topic -> list of sentences, so "more about him" is served without another request
+wikipedia_cache = LRUCache(
+    maxsize=int(os.environ.get('WIKIPEDIA_CACHE_SIZE', 256)),
+    ttl=int(os.environ.get('WIKIPEDIA_CACHE_TTL', 24 * 3600)),
+    shared=shared_cache("wikipedia", ttl=int(os.environ.get('WIKIPEDIA_CACHE_TTL', 24 * 3600))),
+)
+WIKIPEDIA_MAX_SENTENCES = 200
+
+def get_topic_sentences(topic):
+    global wikipedia_backend
+    key = topic.lower()
+    sentences = wikipedia_cache.get(key)
+    if sentences is None:
+        if wikipedia_backend is None:
+            wikipedia_backend = create_wikipedia_backend()
+        with metrics.timer("backend", "wikipedia"):
+            text = wikipedia_backend.fetch(topic)
+        # Drop "== Section ==" headings from the plain-text extract
+        lines = [line for line in text.splitlines() if line.strip() and not line.startswith("==")]
+        sentences = re.split(r"(?<=[.!?])\s+", " ".join(lines))[:WIKIPEDIA_MAX_SENTENCES]
+        wikipedia_cache.set(key, sentences)
+    return sentences
+
+def get_wikipedia_info(query, more=False):
+    try:
+        if not more:
+            session['wiki_topic'] = query
+            session['wiki_offset'] = 0
+        else:
+            query = session.get('wiki_topic')
+            session['wiki_offset'] = session.get('wiki_offset', 0) + 2
+
+        if not query:
+            return "Please ask about a topic first."
+        
+        offset = session.get('wiki_offset', 0)
+        sentences = get_topic_sentences(query)
+        more_info = " ".join(sentences[offset:offset + 2])
+        return more_info if more_info else "No more information available."
+    except Exception as e:
+        return f"Sorry, I couldn't find information on that topic. Error: {str(e)}"
+
+# --- Current Affairs ---
+class NewsAPIBackend:
+    """Fetches top headlines from NewsAPI (or any server speaking its API) over a pooled session"""
+
+    def __init__(self, api_key, base_url="https://newsapi.org/v2", timeout=5):
+        self.api_key = api_key
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self.session = None  # created on first fetch so requests isn't imported at startup
+
+    def fetch(self, country, category=None):
+        if self.session is None:
+            import requests
+            self.session = requests.Session()
+        params = {"country": country, "apiKey": self.api_key}
+        if category:
+            params["category"] = category
+        response = self.session.get(f"{self.base_url}/top-headlines", params=params, timeout=self.timeout)
+        response.raise_for_status()  # Raise an exception for bad status codes
+        return [article['title'] for article in response.json().get("articles", [])]
+
+class CircuitBreaker:
+    """Stops calling a failing upstream for reset_timeout seconds after repeated errors"""
+
+    def __init__(self, failure_threshold=3, reset_timeout=60):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self.lock = threading.Lock()
+
+    def allow(self):
+        with self.lock:
+            if self.opened_at is None:
+                return True
+            # Half-open: let one call through once the cool-down has passed
+            if time.monotonic() - self.opened_at >= self.reset_timeout:
+                self.opened_at = time.monotonic()
+                return True
+            return False
+
+    def record_success(self):
+        with self.lock:
+            self.failures = 0
+            self.opened_at = None
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+
+class HeadlineCache:
+    """Headlines per (country, category), refreshed by a background thread.
+
+    Fresh entries are served directly; stale ones are served while a refresh
+    runs in the background, so only the very first request for a feed waits
+    on the upstream.
+    """
+
+    def __init__(self, backend, refresh_interval=600, feeds=()):
+        self.backend = backend
+        self.refresh_interval = refresh_interval
+        self.breaker = CircuitBreaker()
+        self.entries = {}  # (country, category) -> (headlines, fetched_at)
+        self.feeds = set(feeds)
+        self.refreshing = set()
+        self.lock = threading.Lock()
+        self.thread = None
+        self.hits = 0
+        self.misses = 0
+
+    def start(self):
+        with self.lock:
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._run, name="headline-refresh", daemon=True)
+                self.thread.start()
+
+    def _run(self):
+        while True:
+            # The request that started this thread is fetching its feed itself
+            time.sleep(self.refresh_interval)
+            for feed in list(self.feeds):
+                entry = self.entries.get(feed)
+                # Skip feeds a request refreshed in the last half interval
+                if entry is None or time.monotonic() - entry[1] >= self.refresh_interval / 2:
+                    self.refresh(feed)
+
+    def refresh(self, feed):
+        """Fetch one feed, keeping the old headlines if the upstream fails"""
+        if not self.breaker.allow():
+            return
+        try:
+            with metrics.timer("backend", "newsapi"):
+                headlines = self.backend.fetch(*feed)
+        except Exception as e:
+            print(f"Error fetching current affairs: {e}")
+            self.breaker.record_failure()
+            return
+        self.breaker.record_success()
+        with self.lock:
+            self.entries[feed] = (headlines, time.monotonic())
+
+    def _refresh_in_background(self, feed):
+        with self.lock:
+            if feed in self.refreshing:
+                return
+            self.refreshing.add(feed)
+
+        def run():
+            try:
+                self.refresh(feed)
+            finally:
+                with self.lock:
+                    self.refreshing.discard(feed)
+
+        threading.Thread(target=run, daemon=True).start()
+
+    def get(self, country, category=None):
+        """Return the headlines for a feed, or None if none could be fetched"""
+        feed = (country, category)
+        self.feeds.add(feed)
+        self.start()
+        entry = self.entries.get(feed)
+        if entry is None:
+            self.misses += 1
+            self.refresh(feed)
+            entry = self.entries.get(feed)
+            return entry[0] if entry else None
+        self.hits += 1
+        if time.monotonic() - entry[1] > self.refresh_interval:
+            self._refresh_in_background(feed)
+        return entry[0]
+
+    def stats(self):
+        return {
+            "cache_hits": self.hits,
+            "cache_misses": self.misses,
+            "feeds": len(self.feeds),
+            "circuit_open": self.breaker.opened_at is not None,
+        }
+
+NEWS_CATEGORIES = ["business", "entertainment", "health", "science", "sports", "technology"]
+NEWS_COUNTRY = os.environ.get('NEWS_COUNTRY', 'in')
+
+headline_cache = HeadlineCache(
+    NewsAPIBackend(
+        # API Key for NewsAPI.org; set NEWSAPI_KEY to use your own
+        api_key=os.environ.get('NEWSAPI_KEY', "26d03ad1d52f4222a123717cc2dea0b5"),
+        base_url=os.environ.get('NEWSAPI_URL', "https://newsapi.org/v2"),
+        timeout=float(os.environ.get('NEWSAPI_TIMEOUT', 5)),
+    ),
+    refresh_interval=int(os.environ.get('NEWS_REFRESH_SECONDS', 600)),
+    feeds=[(NEWS_COUNTRY, None)],
+)
+
+def get_current_affairs(country=None, category=None):
+    """Returns the top news headlines from the headline cache."""
+    headlines = headline_cache.get(country or NEWS_COUNTRY, category)
+    if headlines is None:
+        return "Sorry, I'm having trouble fetching the news at the moment."
+    if not headlines:
+        return "Sorry, I couldn't fetch the latest news right now."
+    return "\n".join(["📰 Here are the top 5 headlines:"] + [f"- {title}" for title in headlines[:5]])
+
+# --- Document Store ---
+# Uploaded documents live on the server; the session cookie only holds their ID.
+class DocumentQuotaError(Exception):
+    pass
+
+class DocumentStore:
+    """Shared put/get logic for the document store backends"""
+
+    def __init__(self, ttl=3600, quota_bytes=20 * 1024 * 1024):
+        self.ttl = ttl
+        self.quota_bytes = quota_bytes
+        self.lock = threading.Lock()
+
+    def put(self, owner, text, loading=False):
+        """Store text for owner and return its document ID; loading marks it as still being appended to"""
+        size = len(text.encode("utf-8"))
+        if size > self.quota_bytes:
+            raise DocumentQuotaError(f"Document is too large ({size // 1024} KB). The limit is {self.quota_bytes // 1024} KB.")
+        doc_id = uuid.uuid4().hex
+        now = time.time()
+        with self.lock:
+            self._purge_expired(now)
+            # Make room within the owner's quota by dropping their oldest documents
+            for old_id, old_size in self._owner_documents(owner):
+                if self._owner_usage(owner) + size <= self.quota_bytes:
+                    break
+                self._delete(old_id)
+            self._insert(doc_id, owner, text, size, now + self.ttl, loading)
+        return doc_id
+
+    def get(self, doc_id):
+        """Return the document text, or None if it is unknown or expired"""
+        if not doc_id:
+            return None
+        with self.lock:
+            return self._select(doc_id, time.time())
+
+    def read(self, doc_id, start, length):
+        """Return length characters of a document from offset start, or None if it is unknown or expired"""
+        if not doc_id:
+            return None
+        with self.lock:
+            return self._select_range(doc_id, time.time(), start, length)
+
+    def append(self, doc_id, text):
+        """Add text to the end of a stored document, within its owner's quota"""
+        size = len(text.encode("utf-8"))
+        with self.lock:
+            owner = self._owner_of(doc_id)
+            if owner is None:
+                raise KeyError(f"document {doc_id} has expired")
+            if self._owner_usage(owner) + size > self.quota_bytes:
+                raise DocumentQuotaError(f"Document is too large. The limit is {self.quota_bytes // 1024} KB.")
+            self._append(doc_id, text, size)
+
+    def is_loading(self, doc_id):
+        """True while the uploader is still appending to the document"""
+        if not doc_id:
+            return False
+        with self.lock:
+            return self._loading(doc_id)
+
+    def finish_loading(self, doc_id):
+        if doc_id:
+            with self.lock:
+                self._set_loading(doc_id, False)
+
+    def delete(self, doc_id):
+        if doc_id:
+            with self.lock:
+                self._delete(doc_id)
+
+
+class MemoryDocumentStore(DocumentStore):
+    """In-process LRU store, bounded by the total size of all documents"""
+
+    def __init__(self, max_bytes=256 * 1024 * 1024, **kwargs):
+        super().__init__(**kwargs)
+        self.max_bytes = max_bytes
+        self.total_bytes = 0
+        self.documents = OrderedDict()  # doc_id -> (owner, text, size, expires, loading)
+
+    def _purge_expired(self, now):
+        for doc_id in [d for d, entry in self.documents.items() if entry[3] <= now]:
+            self._delete(doc_id)
+
+    def _owner_documents(self, owner):
+        return [(d, entry[2]) for d, entry in self.documents.items() if entry[0] == owner]
+
+    def _owner_usage(self, owner):
+        return sum(entry[2] for entry in self.documents.values() if entry[0] == owner)
+
+    def _insert(self, doc_id, owner, text, size, expires, loading):
+        self.documents[doc_id] = (owner, text, size, expires, loading)
+        self.total_bytes += size
+        self._trim()
+
+    def _append(self, doc_id, text, size):
+        owner, old_text, old_size, expires, loading = self.documents[doc_id]
+        self.documents[doc_id] = (owner, old_text + text, old_size + size, expires, loading)
+        self.documents.move_to_end(doc_id)
+        self.total_bytes += size
+        self._trim()
+
+    def _trim(self):
+        while self.total_bytes > self.max_bytes and len(self.documents) > 1:
+            self._delete(next(iter(self.documents)))
+
+    def _owner_of(self, doc_id):
+        entry = self.documents.get(doc_id)
+        return entry[0] if entry else None
+
+    def _loading(self, doc_id):
+        entry = self.documents.get(doc_id)
+        return bool(entry and entry[4])
+
+    def _set_loading(self, doc_id, loading):
+        entry = self.documents.get(doc_id)
+        if entry is not None:
+            self.documents[doc_id] = entry[:4] + (loading,)
+
+    def _select(self, doc_id, now):
+        entry = self.documents.get(doc_id)
+        if entry is None:
+            return None
+        if entry[3] <= now:
+            self._delete(doc_id)
+            return None
+        self.documents.move_to_end(doc_id)
+        return entry[1]
+
+    def _select_range(self, doc_id, now, start, length):
+        text = self._select(doc_id, now)
+        return None if text is None else text[start:start + length]
+
+    def _delete(self, doc_id):
+        entry = self.documents.pop(doc_id, None)
+        if entry is not None:
+            self.total_bytes -= entry[2]
+
+
+class SqliteDocumentStore(DocumentStore):
+    """On-disk store so documents survive restarts and are shared by worker processes"""
+
+    def __init__(self, path="documents.db", **kwargs):
+        super().__init__(**kwargs)
+        self.path = path
+        self._connect()
+        # A pre-fork master's connection can't be used by its workers
+        os.register_at_fork(after_in_child=self._connect)
+
+    def _connect(self):
+        import sqlite3
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None, timeout=5)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS documents ("
+            "id TEXT PRIMARY KEY, owner TEXT, content TEXT, size INTEGER, created REAL, expires REAL, "
+            "loading INTEGER NOT NULL DEFAULT 0)"
+        )
+        # Files created before the loading flag existed
+        columns = [row[1] for row in self.conn.execute("PRAGMA table_info(documents)")]
+        if "loading" not in columns:
+            self.conn.execute("ALTER TABLE documents ADD COLUMN loading INTEGER NOT NULL DEFAULT 0")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS documents_owner ON documents (owner, created)")
+
+    def _purge_expired(self, now):
+        self.conn.execute("DELETE FROM documents WHERE expires <= ?", (now,))
+
+    def _owner_documents(self, owner):
+        return self.conn.execute(
+            "SELECT id, size FROM documents WHERE owner = ? ORDER BY created", (owner,)
+        ).fetchall()
+
+    def _owner_usage(self, owner):
+        row = self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM documents WHERE owner = ?", (owner,)).fetchone()
+        return row[0]
+
+    def _insert(self, doc_id, owner, text, size, expires, loading):
+        self.conn.execute(
+            "INSERT INTO documents (id, owner, content, size, created, expires, loading) VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (doc_id, owner, text, size, time.time(), expires, int(loading)),
+        )
+
+    def _append(self, doc_id, text, size):
+        self.conn.execute(
+            "UPDATE documents SET content = content || ?, size = size + ? WHERE id = ?", (text, size, doc_id)
+        )
+
+    def _owner_of(self, doc_id):
+        row = self.conn.execute("SELECT owner FROM documents WHERE id = ?", (doc_id,)).fetchone()
+        return row[0] if row else None
+
+    def _loading(self, doc_id):
+        row = self.conn.execute("SELECT loading FROM documents WHERE id = ?", (doc_id,)).fetchone()
+        return bool(row and row[0])
+
+    def _set_loading(self, doc_id, loading):
+        self.conn.execute("UPDATE documents SET loading = ? WHERE id = ?", (int(loading), doc_id))
+
+    def _select(self, doc_id, now):
+        row = self.conn.execute(
+            "SELECT content FROM documents WHERE id = ? AND expires > ?", (doc_id, now)
+        ).fetchone()
+        return row[0] if row else None
+
+    def _select_range(self, doc_id, now, start, length):
+        # substr() is 1-based and counts characters, so only the slice leaves SQLite
+        row = self.conn.execute(
+            "SELECT substr(content, ?, ?) FROM documents WHERE id = ? AND expires > ?", (start + 1, length, doc_id, now)
+        ).fetchone()
+        return row[0] if row else None
+
+    def _delete(self, doc_id):
+        self.conn.execute("DELETE FROM documents WHERE id = ?", (doc_id,))
+
+
+def create_document_store():
+    options = {
+        "ttl": int(os.environ.get('DOCUMENT_TTL', 3600)),
+        "quota_bytes": int(os.environ.get('DOCUMENT_QUOTA_BYTES', 20 * 1024 * 1024)),
+    }
+    if os.environ.get('DOCUMENT_STORE', 'memory') == 'sqlite':
+        return SqliteDocumentStore(path=os.environ.get('DOCUMENT_STORE_PATH', 'documents.db'), **options)
+    return MemoryDocumentStore(max_bytes=int(os.environ.get('DOCUMENT_STORE_MAX_BYTES', 256 * 1024 * 1024)), **options)
+
+document_store = create_document_store()
+
+def session_user_id():
+    if 'user_id' not in session:
+        session['user_id'] = uuid.uuid4().hex
+    return session['user_id']
+
+def adopt_document(doc_id, finished=False):
+    """Make a stored upload the session's document.
+
+    The document it replaces is only dropped once the upload has finished, so
+    restore_document() can hand it back if the upload is cancelled first.
+    """
+    if session.get('document_id') != doc_id:
+        session['previous_document_id'] = session.get('document_id')
+        session['document_id'] = doc_id
+        session['pending_document'] = True
+    if finished:
+        document_store.delete(session.pop('previous_document_id', None))
+
+def restore_document(doc_id):
+    """Undo adopt_document() for an upload that was cancelled"""
+    if session.get('document_id') == doc_id:
+        session['document_id'] = session.pop('previous_document_id', None)
+        session['pending_document'] = session['document_id'] is not None
+
+def load_document():
+    return document_store.get(session.get('document_id'))
+
+def wait_until_loaded(doc_id, timeout):
+    """Wait up to timeout seconds for an upload that is still being extracted; True once it is complete"""
+    deadline = time.monotonic() + timeout
+    while document_store.is_loading(doc_id):
+        if time.monotonic() >= deadline:
+            return False
+        time.sleep(0.1)
+    return True
+
+# --- Streaming Read-out ---
+# "read out" hands the client a /read URL instead of the whole document; the
+# document is sent a paragraph or a few sentences at a time, each tagged with
+# the character offset to resume from.
+READ_CHUNK_CHARS = int(os.environ.get('READ_CHUNK_CHARS', 600))
+READ_BLOCK_CHARS = 64 * 1024
+# Stop following a loading document that has had nothing appended for this long
+READ_LOADING_STALL = float(os.environ.get('READ_LOADING_STALL', 30))
+CHUNK_BREAK = re.compile(r"\n\s*\n|(?<=[.!?])\s+")
+
+def chunk_end(text, limit):
+    """Length of the next chunk: up to the last paragraph or sentence break within limit"""
+    end = 0
+    for match in CHUNK_BREAK.finditer(text, 0, limit):
+        end = match.end()
+    if end:
+        return end
+    space = text.rfind(" ", 0, limit)
+    return space + 1 if space > 0 else limit
+
+def iter_document_chunks(doc_id, cursor=0, chunk_chars=None):
+    """Yield (text, next cursor) for a stored document, starting at character offset cursor.
+
+    The document is read from the store a block at a time. A PDF that is still
+    being extracted is followed until its last page has been appended.
+    """
+    chunk_chars = chunk_chars or READ_CHUNK_CHARS
+    buffer = ""
+    stalled_since = None
+    while True:
+        while len(buffer) > chunk_chars:
+            end = chunk_end(buffer, chunk_chars)
+            cursor += end
+            text, buffer = buffer[:end].strip(), buffer[end:]
+            if text:
+                yield text, cursor
+        block = document_store.read(doc_id, cursor + len(buffer), READ_BLOCK_CHARS)
+        if block is None:
+            return
+        if not block:
+            # The flag lives in the store, so any worker process can see it
+            if document_store.is_loading(doc_id):
+                stalled_since = stalled_since or time.monotonic()
+                if time.monotonic() - stalled_since < READ_LOADING_STALL:
+                    time.sleep(0.1)
+                    continue
+            break
+        stalled_since = None
+        buffer += block
+    if buffer.strip():
+        yield buffer.strip(), cursor + len(buffer)
+
+# --- Intent Router ---
+class TriggerAutomaton:
+    """Aho-Corasick automaton that finds every trigger phrase in one pass"""
+
+    def __init__(self, phrases):
+        # phrases is a list of (phrase, payload); the payload is yielded on a match
+        self.goto = [{}]
+        self.fail = [0]
+        self.output = [[]]
+        for phrase, payload in phrases:
+            if not phrase:
+                continue
+            state = 0
+            for ch in phrase:
+                nxt = self.goto[state].get(ch)
+                if nxt is None:
+                    nxt = len(self.goto)
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.output.append([])
+                    self.goto[state][ch] = nxt
+                state = nxt
+            self.output[state].append((len(phrase), payload))
+
+        # Breadth-first pass to build the failure links
+        queue = deque(self.goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for ch, nxt in self.goto[state].items():
+                queue.append(nxt)
+                fallback = self.fail[state]
+                while fallback and ch not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+                target = self.goto[fallback].get(ch, 0)
+                self.fail[nxt] = target if target != nxt else 0
+                self.output[nxt] = self.output[nxt] + self.output[self.fail[nxt]]
+
+    def find_all(self, text):
+        """Yield (start, payload) for every trigger occurring in text"""
+        goto, fail, output = self.goto, self.fail, self.output
+        state = 0
+        for pos, ch in enumerate(text):
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            for length, payload in output[state]:
+                yield pos - length + 1, payload
+
+
+class IntentRouter:
+    """Dispatch a message to the highest-priority intent whose trigger it contains.
+
+    All trigger phrases are compiled into one automaton, so matching is a single
+    pass over the message however many intents are registered. Handlers are
+    called as handler(message, trigger) in priority order and may return None
+    to fall through to the next matched intent.
+    """
+
+    def __init__(self):
+        self.intents = {}
+        self.automaton = None
+
+    def register(self, name, priority, triggers, handler, prefix=False, kind="inline", whole_word=False,
+                 cache=0, session_keys=()):
+        """Add or replace an intent. With prefix=True triggers only match at the start,
+        with whole_word=True only between word boundaries ("hi" but not "chills").
+
+        kind tells the async path where to run the handler: "inline" on the
+        event loop, "io" or "cpu" on the matching executor with a timeout.
+        cache is how many seconds the handler's reply to a message stays valid
+        (0: never cache, e.g. for the time or anything random); session_keys
+        are the session entries it sets, which are cached with the reply.
+        """
+        self.intents[name] = {
+            "priority": priority,
+            "triggers": [t.lower() for t in triggers],
+            "handler": handler,
+            "prefix": prefix,
+            "kind": kind,
+            "whole_word": whole_word,
+            "cache": cache,
+            "session_keys": tuple(session_keys),
+        }
+        self.automaton = None
+
+    def compile(self):
+        phrases = []
+        for name, intent in self.intents.items():
+            for index, trigger in enumerate(intent["triggers"]):
+                phrases.append((trigger, (name, index)))
+        self.automaton = TriggerAutomaton(phrases)
+        return self.automaton
+
+    def match(self, message):
+        """Return [(intent_name, trigger)] for every matched intent, highest priority first"""
+        automaton = self.automaton or self.compile()
+        best = {}
+        for start, (name, index) in automaton.find_all(message):
+            intent = self.intents[name]
+            if intent["prefix"] and start != 0:
+                continue
+            if intent["whole_word"] and not self._on_word_boundaries(message, start, len(intent["triggers"][index])):
+                continue
+            # Earlier triggers win within an intent, like the old in-order scans
+            if name not in best or index < best[name]:
+                best[name] = index
+        ordered = sorted(best, key=lambda n: self.intents[n]["priority"])
+        return [(name, self.intents[name]["triggers"][best[name]]) for name in ordered]
+
+    @staticmethod
+    def _on_word_boundaries(message, start, length):
+        end = start + length
+        return ((start == 0 or not message[start - 1].isalnum())
+                and (end == len(message) or not message[end].isalnum()))
+
+    def cache_ttl(self, names):
+        """How long a reply produced by these intents may be cached: the shortest of their lifetimes"""
+        return min((self.intents[name]["cache"] for name in names), default=0)
+
+    def session_keys(self, names):
+        return [key for name in names for key in self.intents[name]["session_keys"]]
+
+    def dispatch(self, message, invoked=None):
+        """Reply from the first matched handler that returns one; invoked collects the intents tried"""
+        for name, trigger in self.match(message):
+            if invoked is not None:
+                invoked.append(name)
+            with metrics.timer("intent", name):
+                result = self.intents[name]["handler"](message, trigger)
+            if result:
+                return result
+        return None
+
+    async def dispatch_async(self, message, invoked=None):
+        """Like dispatch(), but blocking handlers run on executors instead of the event loop"""
+        for name, trigger in self.match(message):
+            if invoked is not None:
+                invoked.append(name)
+            intent = self.intents[name]
+            if intent["kind"] == "inline":
+                with metrics.timer("intent", name):
+                    result = intent["handler"](message, trigger)
+            else:
+                try:
+                    with metrics.timer("intent", name):
+                        result = await run_in_executor(intent["kind"], intent["handler"], message, trigger)
+                except asyncio.TimeoutError:
+                    return ASYNC_TIMEOUT_REPLY
+            if result:
+                return result
+        return None
+
+# Executors for the async path; separate pools so slow upstreams can't starve the math solver
+ASYNC_IO_WORKERS = int(os.environ.get('ASYNC_IO_WORKERS', 32))
+ASYNC_CPU_WORKERS = int(os.environ.get('ASYNC_CPU_WORKERS', 4))
+ASYNC_TIMEOUTS = {
+    "io": float(os.environ.get('ASYNC_IO_TIMEOUT', 8)),
+    "cpu": float(os.environ.get('ASYNC_CPU_TIMEOUT', 15)),
+}
+ASYNC_TIMEOUT_REPLY = "Sorry, that is taking too long right now. Please try again."
+async_executors = {}
+
+async def run_in_executor(kind, func, *args):
+    """Run func on the "io" or "cpu" executor, keeping the request context, with a timeout"""
+    from concurrent.futures import ThreadPoolExecutor
+    if kind not in async_executors:
+        workers = ASYNC_IO_WORKERS if kind == "io" else ASYNC_CPU_WORKERS
+        async_executors[kind] = ThreadPoolExecutor(max_workers=workers, thread_name_prefix=f"async-{kind}")
+    loop = asyncio.get_running_loop()
+    # Copy the context so the handler still sees this request's session
+    context = contextvars.copy_context()
+    future = loop.run_in_executor(async_executors[kind], context.run, func, *args)
+    return await asyncio.wait_for(future, ASYNC_TIMEOUTS[kind])
+
+def static_reply(text):
+    return lambda message, trigger: text
+
+def current_time_reply(message, trigger):
+    now = datetime.datetime.now()
+    return now.strftime("Current time is %I:%M %p")
+
+def current_affairs_reply(message, trigger):
+    category = next((c for c in NEWS_CATEGORIES if c in message), None)
+    return get_current_affairs(category=category)
+
+def wikipedia_reply(message, trigger):
+    topic = message.replace("about", "").replace("who is", "").replace("what is", "").strip()
+    return get_wikipedia_info(topic, more=False)
+
+def wikipedia_more_reply(message, trigger):
+    return get_wikipedia_info("", more=True)
+
+def program_reply(message, trigger):
+    try:
+        return format_program_snippet(program_keys[trigger])
+    except KeyError:
+        # Removed from programs.json since the router was built
+        return None
+
+def basic_math_reply(message, trigger):
+    return evaluate_math_expression(message)
+
+def advanced_math_reply(message, trigger):
+    return advanced_math_solver(message)
+
+def disease_reply(message, trigger):
+    return get_disease_info(message)
+
+def story_reply(message, trigger):
+    key_points = {"character": "young prince", "setting": "magical forest", "conflict": "an evil dragon", "resolution": "outsmarting the dragon using clever tricks"}
+    return generate_story(key_points)
+
+# Lowercased programs.json key -> original key (first one wins, like the old scan)
+program_keys = {}
+
+def register_program_intent(router):
+    keys = {}
+    for key in snippet_index.keys():
+        keys.setdefault(key.lower(), key)
+    program_keys.clear()
+    program_keys.update(keys)
+    # Longest key first, so "bubble sort" beats "sort" when both match
+    router.register("program", 130, sorted(keys, key=len, reverse=True), program_reply, cache=RESPONSE_CACHE_TTL)
+
+def build_intent_router():
+    """Register every intent in the same priority order as the old if/elif chain"""
+    router = IntentRouter()
+    # Replies that only depend on the message are cached for RESPONSE_CACHE_TTL;
+    # the time, news, "tell me more" and stories are not
+    cached = RESPONSE_CACHE_TTL
+    router.register("name", 10, ["what is your name"], static_reply("My name is Virtual Assistant"), cache=cached)
+    router.register("greeting", 20, ["hello", "hye", "hay", "hi"], static_reply("Hey sir, how can I help you!"), whole_word=True, cache=cached)
+    router.register("how_are_you", 30, ["how are you"], static_reply("I am doing great these days, sir."), cache=cached)
+    router.register("thanks", 40, ["thanku", "thank"], static_reply("It's my pleasure, sir, to stay with you."), cache=cached)
+    router.register("good_morning", 50, ["good morning"], static_reply("Good morning sir, I think you might need some help."), cache=cached)
+    router.register("time", 60, ["time now"], current_time_reply)
+    router.register("current_affairs", 70, ["current affairs"], current_affairs_reply, kind="io")
+    router.register("open_youtube", 80, ["open youtube"], static_reply("OPEN_YOUTUBE"), cache=cached)
+    router.register("open_google", 81, ["open google"], static_reply("OPEN_GOOGLE"), cache=cached)
+    router.register("open_facebook", 82, ["open facebook"], static_reply("OPEN_FACEBOOK"), cache=cached)
+    router.register("open_sbtet", 83, ["open sbtet"], static_reply("OPEN_SBTET"), cache=cached)
+    router.register("open_music", 84, ["open music"], static_reply("OPEN_MUSIC"), cache=cached)
+    router.register("shutdown", 90, ["shutdown", "quit"], static_reply("Ok sir. Shutting down."), cache=cached)
+    # A cached article replays the topic it saved in the session, so "more about him" still works
+    router.register("wikipedia", 100, ["about ", "who is ", "what is "], wikipedia_reply, prefix=True, kind="io",
+                    cache=cached, session_keys=["wiki_topic", "wiki_offset"])
+    router.register("wikipedia_more", 110, ["more about him", "more about her"], wikipedia_more_reply, kind="io")
+    register_program_intent(router)
+    # Plain arithmetic always contains at least one digit
+    router.register("basic_math", 140, list("0123456789"), basic_math_reply, cache=cached)
+    router.register("advanced_math", 150, ["solve", "differentiate", "derivative", "integrate", "simplify", "limit"], advanced_math_reply, kind="cpu", cache=cached)
+    # The index does the whole-word matching; any word it knows is enough to try it
+    router.register("disease", 160, disease_index.trigger_words(), disease_reply, cache=cached)
+    router.register("story", 170, ["tell me a story"], story_reply)
+    router.compile()
+    return router
+
+# --- Response Cache ---
+RESPONSE_CACHE_SIZE = int(os.environ.get('RESPONSE_CACHE_SIZE', 1024))
+RESPONSE_CACHE_TTL = int(os.environ.get('RESPONSE_CACHE_TTL', 3600))
+# Sentence punctuation at the end of a message; "5!" keeps its factorial
+TRAILING_PUNCTUATION = re.compile(r"(?:[?.,;:]|(?<![\d)])!)+$")
+
+def normalize_message(message):
+    """Lowercase, collapse whitespace and drop trailing punctuation ("What is  AI?" becomes "what is ai")"""
+    return TRAILING_PUNCTUATION.sub("", " ".join(message.lower().split())).rstrip()
+
+class ResponseCache:
+    """Router replies keyed by normalized message, kept for as long as the intents that produced them allow.
+
+    Each entry remembers the session keys its intent declares, and a hit
+    writes them again, so a cached Wikipedia answer still sets up "tell me more".
+    Replies starting with "Sorry" are failures and are never stored. Send
+    the header X-Cache-Bypass: 1 to skip the cache for one request.
+    """
+
+    def __init__(self, maxsize):
+        self.cache = LRUCache(maxsize)
+        self.bypassed = 0
+
+    def get(self, message):
+        """The cached reply, or None; records HIT, MISS or BYPASS in g for the X-Cache header"""
+        if self.cache.maxsize <= 0 or request.headers.get("X-Cache-Bypass") == "1":
+            self.bypassed += 1
+            g.response_cache = "BYPASS"
+            return None
+        entry = self.cache.get(message)
+        if entry is None:
+            g.response_cache = "MISS"
+            return None
+        reply, changes = entry
+        session.update(changes)
+        g.response_cache = "HIT"
+        return reply
+
+    def remember(self, message, reply, ttl, session_keys=()):
+        """Store a reply produced after a miss, with the current values of session_keys"""
+        if ttl <= 0 or g.get("response_cache") != "MISS" or not isinstance(reply, str) or reply.startswith("Sorry"):
+            return
+        changes = {key: session[key] for key in session_keys if key in session}
+        self.cache.set(message, (reply, changes), ttl=ttl)
+
+    def clear(self):
+        self.cache.clear()
+
+    def stats(self):
+        lookups = self.cache.hits + self.cache.misses
+        return {
+            "size": len(self.cache),
+            "hits": self.cache.hits,
+            "misses": self.cache.misses,
+            "hit_rate": round(self.cache.hits / lookups, 3) if lookups else 0.0,
+            "bypassed": self.bypassed,
+        }
+
+response_cache = ResponseCache(RESPONSE_CACHE_SIZE)
+
+# --- Assistant Logic ---
+FALLBACK_REPLY = "Sorry, I didn't understand that. Try asking about diseases, math problems, or say 'open YouTube' or upload a file or image."
+
+DOCUMENT_EXPIRED_REPLY = {
+    "text": "Sorry, that document has expired. Please upload it again.",
+    "speak": "Sorry, that document has expired. Please upload it again.",
+    "full_content": None
+}
+
+def pending_document_reply(data_btn):
+    """Handle the reply to the 'read out or summarize?' question after an upload"""
+    if "read" in data_btn or "read out" in data_btn or "full" in data_btn:
+        session['pending_document'] = False
+        if document_store.read(session.get('document_id'), 0, 0) is None:
+            return DOCUMENT_EXPIRED_REPLY
+        # The client pulls the text itself from /read, a chunk at a time
+        return {
+            "text": "📖 Reading the full document...",
+            "speak": "Reading the full document.",
+            "full_content": None,
+            "stream": "/read"
+        }
+    elif "summarize" in data_btn or "summary" in data_btn or "short" in data_btn or "main points" in data_btn:
+        complete = wait_until_loaded(session.get('document_id'), SUMMARY_LOADING_WAIT)
+        content = load_document()
+        session['pending_document'] = False
+        if content is None:
+            return DOCUMENT_EXPIRED_REPLY
+        summary = summarize_text(content)
+        if not complete:
+            summary = "⏳ The rest of the document is still loading, so this summary only covers the pages read so far.\n\n" + summary
+        return {
+            "text": summary,
+            "speak": summary,
+            "full_content": None
+        }
+    else:
+        return {
+            "text": "Please choose an option: 'read out' for full content or 'summarize' for main points.",
+            "speak": "Please choose read out or summarize",
+            "full_content": None
+        }
+
+def assistant_logic(send):
+    data_btn = normalize_message(send)
+
+    # Check if user is responding to document action request
+    if session.get('pending_document'):
+        return pending_document_reply(data_btn)
+
+    # Pick up edits to programs.json without a restart
+    if snippet_index.reload_if_changed():
+        register_program_intent(intent_router)
+        response_cache.clear()
+
+    reply = response_cache.get(data_btn)
+    if reply is not None:
+        return reply
+
+    # Greetings, commands, wikipedia, programs, math, diseases and stories
+    # are all matched in a single pass by the intent router
+    invoked = []
+    reply = intent_router.dispatch(data_btn, invoked)
+    if reply:
+        response_cache.remember(data_btn, reply, intent_router.cache_ttl(invoked), intent_router.session_keys(invoked))
+        return reply
+
+    return FALLBACK_REPLY
+
+async def assistant_logic_async(send):
+    """assistant_logic for the ASGI entry point: network and math handlers don't block the event loop"""
+    data_btn = normalize_message(send)
+
+    if session.get('pending_document'):
+        # Loading and summarizing the document is CPU work
+        try:
+            return await run_in_executor("cpu", pending_document_reply, data_btn)
+        except asyncio.TimeoutError:
+            return ASYNC_TIMEOUT_REPLY
+
+    if snippet_index.reload_if_changed():
+        register_program_intent(intent_router)
+        response_cache.clear()
+
+    reply = response_cache.get(data_btn)
+    if reply is not None:
+        return reply
+
+    invoked = []
+    reply = await intent_router.dispatch_async(data_btn, invoked)
+    if reply:
+        response_cache.remember(data_btn, reply, intent_router.cache_ttl(invoked), intent_router.session_keys(invoked))
+        return reply
+
+    return FALLBACK_REPLY
+
+intent_router = build_intent_router()
+
+# --- File Reading Functions ---
+PDF_MAX_PAGES = int(os.environ.get('PDF_MAX_PAGES', 1000))
+PDF_MAX_CHARS = int(os.environ.get('PDF_MAX_CHARS', 5_000_000))
+# Files with at least this many pages are split across worker processes
+PDF_PARALLEL_PAGES = int(os.environ.get('PDF_PARALLEL_PAGES', 100))
+PDF_CHUNK_PAGES = int(os.environ.get('PDF_CHUNK_PAGES', 25))
+PDF_WORKERS = int(os.environ.get('PDF_WORKERS', min(4, os.cpu_count() or 1)))
+
+pdf_executor = None
+
+def get_pdf_executor():
+    global pdf_executor
+    if pdf_executor is None:
+        import multiprocessing
+        from concurrent.futures import ProcessPoolExecutor
+        pdf_executor = ProcessPoolExecutor(max_workers=PDF_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+    return pdf_executor
+
+def iter_pdf_pages_parallel(path, count):
+    """Extract page ranges in worker processes, yielding pages in document order"""
+    import pdf_worker
+    starts = list(range(0, count, PDF_CHUNK_PAGES))
+    stops = [min(start + PDF_CHUNK_PAGES, count) for start in starts]
+    for pages in get_pdf_executor().map(pdf_worker.extract_page_range, [path] * len(starts), starts, stops):
+        yield from pages
+
+def iter_pdf_pages(source, max_pages=None, max_chars=None):
+    """Yield the text of each page, stopping at the page and character caps.
+
+    source is a file object or a path; only paths can be fanned out to
+    worker processes.
+    """
+    from PyPDF2 import PdfReader
+    max_pages = max_pages or PDF_MAX_PAGES
+    max_chars = max_chars or PDF_MAX_CHARS
+    reader = PdfReader(source)
+    count = min(len(reader.pages), max_pages)
+    if isinstance(source, str) and count >= PDF_PARALLEL_PAGES and PDF_WORKERS > 1:
+        pages = iter_pdf_pages_parallel(source, count)
+    else:
+        pages = (reader.pages[i].extract_text() or "" for i in range(count))
+
+    remaining = max_chars
+    for text in pages:
+        if len(text) >= remaining:
+            yield text[:remaining]
+            return
+        remaining -= len(text)
+        yield text
+
+def iter_pdf_chunks(source, pages_per_chunk=None):
+    """Yield the document text a few pages at a time"""
+    pages_per_chunk = pages_per_chunk or PDF_CHUNK_PAGES
+    buffer = []
+    for page in iter_pdf_pages(source):
+        buffer.append(page)
+        if len(buffer) >= pages_per_chunk:
+            yield "".join(buffer)
+            buffer = []
+    if buffer:
+        yield "".join(buffer)
+
+def spool_upload(file, suffix):
+    """Write an uploaded file to a temporary path and return it"""
+    import tempfile
+    handle, path = tempfile.mkstemp(suffix=suffix)
+    with os.fdopen(handle, "wb") as out:
+        file.save(out)
+    return path
+
+DOCX_EXTRACTOR = os.environ.get('DOCX_EXTRACTOR', 'stream')
+WORD_NS = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+
+def iter_docx_blocks(source):
+    """Yield the text of each paragraph and table row of a .docx, in document order.
+
+    word/document.xml is stream-parsed straight out of the zip and every
+    finished block is cleared, so memory stays flat however large the file
+    is. Like python-docx, only body and table-cell paragraphs and top-level
+    tables are read, a paragraph's text comes from its runs (and hyperlink
+    runs) only, and a row's non-empty cells are joined with " | ".
+    """
+    import zipfile
+    from xml.etree.ElementTree import iterparse
+    P, R, HYPERLINK, BR = (WORD_NS + tag for tag in ("p", "r", "hyperlink", "br"))
+    TBL, TR, TC, BODY = (WORD_NS + tag for tag in ("tbl", "tr", "tc", "body"))
+    # Run content and its text, as python-docx renders it; w:t is the element's own text
+    RUN_TEXT = {WORD_NS + "t": None, WORD_NS + "tab": "\t", WORD_NS + "ptab": "\t",
+                WORD_NS + "cr": "\n", WORD_NS + "noBreakHyphen": "-"}
+    BR_TYPE = WORD_NS + "type"
+
+    with zipfile.ZipFile(source) as archive, archive.open("word/document.xml") as xml:
+        body = None
+        stack = []         # tags of the open elements
+        paragraph = []     # text of the paragraph being read
+        paragraphs = 0     # open <w:p> elements (text boxes nest them)
+        keep = False       # the open paragraph sits directly in the body or a cell
+        tables = 0         # open <w:tbl> elements
+        row, cell = [], []
+        for event, elem in iterparse(xml, events=("start", "end")):
+            tag = elem.tag
+            if event == "start":
+                stack.append(tag)
+                if tag == P:
+                    paragraphs += 1
+                    if paragraphs == 1:
+                        paragraph = []
+                        keep = stack[-2] in (BODY, TC)
+                elif tag == TBL:
+                    tables += 1
+                elif tag == TR and tables == 1:
+                    row = []
+                elif tag == TC and tables == 1:
+                    cell = []
+                elif tag == BODY:
+                    body = elem
+                continue
+
+            stack.pop()
+            if tag in RUN_TEXT or tag == BR:
+                # Only content of the paragraph's own runs, not tab stops under w:pPr
+                if paragraphs == 1 and stack[-1] == R and (
+                        stack[-2] == P or (stack[-2] == HYPERLINK and stack[-3] == P)):
+                    if tag == BR:
+                        paragraph.append("\n" if elem.get(BR_TYPE, "textWrapping") == "textWrapping" else "")
+                    else:
+                        paragraph.append(RUN_TEXT[tag] or elem.text or "")
+            elif tag == P:
+                paragraphs -= 1
+                if paragraphs == 0 and keep:
+                    if tables == 0:
+                        text = "".join(paragraph)
+                        if text.strip():
+                            yield text
+                    elif tables == 1:
+                        cell.append("".join(paragraph))
+            elif tag == TC and tables == 1:
+                text = "\n".join(cell).strip()
+                if text:
+                    row.append(text)
+            elif tag == TR and tables == 1:
+                if row:
+                    yield " | ".join(row)
+            elif tag == TBL:
+                tables -= 1
+            else:
+                continue
+            # Drop finished blocks so the tree never grows
+            if paragraphs == 0 and tables == 0 and body is not None:
+                body.clear()
+
+def read_docx_document(file):
+    """Read a .docx through python-docx: all paragraphs, then every table row"""
+    import io
+    from docx import Document
+
+    doc = Document(io.BytesIO(file.read()))
+    full_text = []
+    for para in doc.paragraphs:
+        if para.text.strip():
+            full_text.append(para.text)
+
+    for table in doc.tables:
+        for row in table.rows:
+            row_text = []
+            for cell in row.cells:
+                cell_text = cell.text.strip()
+                if cell_text:
+                    row_text.append(cell_text)
+            if row_text:
+                full_text.append(" | ".join(row_text))
+    return "\n".join(full_text)
+
+def read_docx_file(file):
+    """Read DOCX file; DOCX_EXTRACTOR=python-docx switches to the object-model reader"""
+    try:
+        if DOCX_EXTRACTOR == 'python-docx':
+            result = read_docx_document(file)
+        else:
+            result = "\n".join(iter_docx_blocks(getattr(file, "stream", file)))
+
+        if not result.strip():
+            return "The document appears to be empty."
+
+        return result
+
+    except ImportError:
+        return "Error: python-docx library not installed. Run: pip install python-docx"
+    except Exception as e:
+        return f"Error reading DOCX file: {str(e)}"
+
+def read_txt_file(file):
+    try:
+        return file.read().decode("utf-8")
+    except Exception as e:
+        return f"Error reading TXT: {str(e)}"
+
+# --- Upload Jobs ---
+# Uploads are spooled to disk and processed by a bounded pool per file type, so
+# a burst of photos can't hold up document parsing (or the other way round).
+app.config['MAX_CONTENT_LENGTH'] = int(os.environ.get('MAX_CONTENT_LENGTH', 50 * 1024 * 1024))
+UPLOAD_TYPES = {".png": "image", ".jpg": "image", ".jpeg": "image", ".bmp": "image",
+                ".pdf": "pdf", ".docx": "docx", ".txt": "txt"}
+UPLOAD_WORKERS = {
+    # Enough image workers to fill a caption batch
+    "image": int(os.environ.get('UPLOAD_IMAGE_WORKERS', os.environ.get('CAPTION_MAX_BATCH', 8))),
+    "pdf": int(os.environ.get('UPLOAD_PDF_WORKERS', 2)),
+    "docx": int(os.environ.get('UPLOAD_DOCX_WORKERS', 2)),
+    "txt": int(os.environ.get('UPLOAD_TXT_WORKERS', 2)),
+}
+UPLOAD_QUEUE_DEPTH = int(os.environ.get('UPLOAD_QUEUE_DEPTH', 16))
+UPLOAD_JOB_TTL = int(os.environ.get('UPLOAD_JOB_TTL', 600))
+UPLOAD_WAIT_MAX = float(os.environ.get('UPLOAD_WAIT_MAX', 30))
+
+class UploadQueueFullError(Exception):
+    pass
+
+class JobCancelled(Exception):
+    pass
+
+class UploadJobQueue:
+    """Bounded queue and worker threads per upload type.
+
+    submit() returns at once; workers call handlers[type](job), which returns
+    the reply for the upload. A handler can publish its reply early with
+    ready() and keep working (PDFs keep extracting pages) until it returns.
+    Finished jobs are kept for `ttl` seconds. With a shared tier, job states
+    are also written there, so any worker process can report, wait on or
+    cancel them.
+    """
+
+    SHARED_POLL_SECONDS = 0.2
+
+    def __init__(self, handlers, workers, depth=16, ttl=600, shared=None):
+        self.handlers = handlers
+        self.workers = workers
+        self.depth = depth
+        self.ttl = ttl
+        self.shared = shared
+        self._reset()
+        # Worker threads don't survive a fork; children start their own on demand
+        os.register_at_fork(after_in_child=self._reset)
+
+    def _reset(self):
+        self.lock = threading.Lock()
+        self.jobs = OrderedDict()  # job ID -> job, oldest first
+        self.queues = {kind: queue.Queue(self.depth) for kind in self.handlers}
+        self.threads = {kind: [] for kind in self.handlers}
+        self.running = {kind: 0 for kind in self.handlers}
+        self.counts = {"submitted": 0, "rejected": 0, "done": 0, "error": 0, "cancelled": 0}
+
+    def full(self, kind):
+        """True if kind's queue has no room; the caller turns the upload away, so it counts as rejected"""
+        if not self.queues[kind].full():
+            return False
+        with self.lock:
+            self.counts["rejected"] += 1
+        return True
+
+    def submit(self, kind, owner, path):
+        """Queue the spooled file at path; raises UploadQueueFullError when the queue is full"""
+        job = {
+            "id": uuid.uuid4().hex, "type": kind, "owner": owner, "path": path,
+            "status": "queued", "result": None, "document_id": None,
+            "created": time.time(), "started": None, "finished": None,
+            "cancel": threading.Event(), "settled": threading.Event(),
+        }
+        with self.lock:
+            self._purge(time.time())
+            while len(self.threads[kind]) < self.workers[kind]:
+                thread = threading.Thread(target=self._work, args=(kind,), name=f"upload-{kind}", daemon=True)
+                thread.start()
+                self.threads[kind].append(thread)
+            try:
+                self.queues[kind].put_nowait(job)
+            except queue.Full:
+                self.counts["rejected"] += 1
+                raise UploadQueueFullError(f"Too many {kind} uploads are waiting. Please try again shortly.")
+            self.jobs[job["id"]] = job
+            self.counts["submitted"] += 1
+        self._publish(job)
+        return job
+
+    def ready(self, job, result):
+        """Publish a job's reply while its handler is still running"""
+        job["result"] = result
+        job["settled"].set()
+        self._publish(job)
+
+    def cancelled(self, job_id):
+        """True if the job has been cancelled, from this or another process"""
+        job = self.jobs.get(job_id)
+        if job is not None and job["cancel"].is_set():
+            return True
+        return self.shared is not None and bool(self.shared.get(["cancel", job_id]))
+
+    def check_cancelled(self, job):
+        """Raise JobCancelled if the job has been cancelled"""
+        if self.cancelled(job["id"]):
+            raise JobCancelled()
+
+    def cancel(self, job_id, owner):
+        """Cancel a queued or running job; returns its state, or None if it is unknown"""
+        job = self.jobs.get(job_id)
+        if job is None:
+            record = self.get(job_id, owner)
+            if record is not None and record["status"] in ("queued", "running"):
+                # Running in another process, which checks for this between steps
+                self.shared.set(["cancel", job_id], True)
+            return record
+        if job["owner"] != owner:
+            return None
+        with self.lock:
+            job["cancel"].set()
+            # A queued job is finished here and skipped when it comes off the queue
+            claimed = job["status"] == "queued"
+            if claimed:
+                job["status"] = "cancelled"
+        if claimed:
+            self._finish(job, "cancelled")
+        return self.describe(job)
+
+    def get(self, job_id, owner):
+        job = self.jobs.get(job_id)
+        if job is not None:
+            return self.describe(job) if job["owner"] == owner else None
+        record = self.shared.get(job_id) if self.shared is not None else None
+        return record["job"] if record and record["owner"] == owner else None
+
+    def wait(self, job_id, timeout):
+        """Block until the job has a reply or has finished, for at most timeout seconds"""
+        if timeout <= 0:
+            return
+        job = self.jobs.get(job_id)
+        if job is not None:
+            job["settled"].wait(timeout)
+            return
+        if self.shared is None:
+            return
+        # Running in another process: watch the state it publishes
+        deadline = time.monotonic() + timeout
+        while True:
+            record = self.shared.get(job_id)
+            if record is None or record["job"]["result"] or record["job"]["finished"]:
+                return
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return
+            time.sleep(min(self.SHARED_POLL_SECONDS, remaining))
+
+    @staticmethod
+    def describe(job):
+        return {key: job[key] for key in ("id", "type", "status", "result", "document_id", "created", "started", "finished")}
+
+    def stats(self):
+        stats = dict(self.counts)
+        for kind in self.handlers:
+            stats[f"{kind}_queued"] = self.queues[kind].qsize()
+            stats[f"{kind}_running"] = self.running[kind]
+            stats[f"{kind}_workers"] = self.workers[kind]
+        return stats
+
+    def _work(self, kind):
+        while True:
+            job = self.queues[kind].get()
+            with self.lock:
+                if job["status"] != "queued":
+                    continue
+                job["status"], job["started"] = "running", time.time()
+                self.running[kind] += 1
+            self._publish(job)
+            start = time.perf_counter()
+            try:
+                self.check_cancelled(job)
+                result = self.handlers[kind](job)
+                # Handlers that don't check for cancellation run to the end
+                self.check_cancelled(job)
+                status = "error" if result.get("status") == "error" else "done"
+            except JobCancelled:
+                result, status = None, "cancelled"
+            except Exception as e:
+                result, status = {"status": "error", "message": str(e)}, "error"
+            finally:
+                with self.lock:
+                    self.running[kind] -= 1
+            metrics.observe("upload", kind, time.perf_counter() - start, error=status == "error")
+            self._finish(job, status, result)
+
+    def _finish(self, job, status, result=None):
+        with self.lock:
+            job["status"], job["result"], job["finished"] = status, result, time.time()
+            self.counts[status] += 1
+        if job["path"] and os.path.exists(job["path"]):
+            os.remove(job["path"])
+        if status == "cancelled":
+            # Nobody adopts a cancelled job's document; don't leave it filling the owner's quota
+            document_store.delete(job["document_id"])
+        job["settled"].set()
+        self._publish(job)
+
+    def _publish(self, job):
+        if self.shared is not None:
+            self.shared.set(job["id"], {"owner": job["owner"], "job": self.describe(job)})
+
+    def _purge(self, now):
+        for job_id in [i for i, job in self.jobs.items() if job["finished"] and job["finished"] + self.ttl <= now]:
+            del self.jobs[job_id]
+
+def document_uploaded(label="Document"):
+    return {
+        "type": "document",
+        "message": f"📄 {label} uploaded successfully! What would you like me to do?\n\n1️⃣ Type 'read out' - I'll read the full document\n2️⃣ Type 'summarize' - I'll extract main points for better understanding",
+        "speak": f"{label} uploaded. What would you like me to do? Say read out for full content, or summarize for main points."
+    }
+
+# --- Image Recognition and Captioning ---
+def process_image_upload(job):
+    with open(job["path"], "rb") as f:
+        caption = caption_image_bytes(f.read())
+
+    weapons = ["gun", "knife", "pistol", "bomb", "rifle"]
+    detected_weapons = [weapon for weapon in weapons if weapon in caption.lower()]
+
+    if detected_weapons:
+        warning_message = f"⚠️ Warning: Possible weapon detected ({', '.join(detected_weapons)})."
+        caption = warning_message + "\n" + caption
+
+    return {"caption": caption}
+
+def process_pdf_upload(job):
+    """Store the first pages of a PDF, publish the reply, then append the rest"""
+    try:
+        chunks = iter_pdf_chunks(job["path"])
+        first = next(chunks, "")
+    except Exception as e:
+        return {"status": "error", "message": f"Error reading PDF: {str(e)}"}
+    doc_id = job["document_id"] = document_store.put(job["owner"], first, loading=True)
+    try:
+        upload_jobs.ready(job, document_uploaded())
+        for chunk in chunks:
+            upload_jobs.check_cancelled(job)
+            document_store.append(doc_id, chunk)
+    except JobCancelled:
+        document_store.delete(doc_id)
+        raise
+    except Exception as e:
+        print(f"Stopped reading PDF {doc_id}: {e}")
+    finally:
+        document_store.finish_loading(doc_id)
+    return job["result"]
+
+def process_docx_upload(job):
+    with open(job["path"], "rb") as f:
+        content = read_docx_file(f)
+
+    # Check if there was an error reading the file
+    if content.startswith("Error"):
+        return {"status": "error", "message": content}
+
+    job["document_id"] = document_store.put(job["owner"], content)
+    return document_uploaded()
+
+def process_txt_upload(job):
+    with open(job["path"], "rb") as f:
+        content = read_txt_file(f)
+    job["document_id"] = document_store.put(job["owner"], content)
+    return document_uploaded("Text file")
+
+upload_jobs = UploadJobQueue(
+    {"image": process_image_upload, "pdf": process_pdf_upload, "docx": process_docx_upload, "txt": process_txt_upload},
+    UPLOAD_WORKERS,
+    depth=UPLOAD_QUEUE_DEPTH,
+    ttl=UPLOAD_JOB_TTL,
+    shared=shared_cache("jobs", ttl=UPLOAD_JOB_TTL),
+)
+
+def job_response(job_id, status=200):
+    """The job's state as JSON, after waiting up to ?wait= seconds for its reply"""
+    try:
+        wait = min(float(request.args.get("wait", 0)), UPLOAD_WAIT_MAX)
+    except ValueError:
+        return jsonify({"status": "error", "message": "wait must be a number"}), 400
+    upload_jobs.wait(job_id, wait)
+    record = upload_jobs.get(job_id, session_user_id())
+    if record is None:
+        return jsonify({"status": "error", "message": "Unknown job"}), 404
+    doc_id = record.pop("document_id")
+    # Only the latest document upload replaces the one the session is working on
+    if doc_id and session.get('document_job') == job_id:
+        if record["status"] == "cancelled" or upload_jobs.cancelled(job_id):
+            restore_document(doc_id)
+        elif record["result"] and record["status"] != "error":
+            adopt_document(doc_id, finished=record["status"] == "done")
+    return jsonify(record), (200 if record["result"] or record["finished"] else status)
+
+@app.errorhandler(413)
+def upload_too_large(e):
+    limit = app.config['MAX_CONTENT_LENGTH'] // 1024
+    return jsonify({"status": "error", "message": f"File is too large. The limit is {limit} KB."}), 413
+
+def upload_busy_response():
+    return jsonify({"status": "error", "message": "The server is busy. Please try again shortly."}), 503, {"Retry-After": "5"}
+
+@app.route('/upload', methods=['POST'])
+def upload():
+    """Spool the file and queue it; replies 202 with a job to poll at /jobs/<id>"""
+    file = request.files.get('file') or request.files.get('image')
+    if not file:
+        return jsonify({"status": "no file uploaded"})
+    extension = os.path.splitext(file.filename.lower())[1]
+    kind = UPLOAD_TYPES.get(extension)
+    if kind is None:
+        return jsonify({"status": "error", "message": "Unsupported file type"})
+    # Turn away work the pool can't queue before spending disk on it
+    if upload_jobs.full(kind):
+        return upload_busy_response()
+    path = spool_upload(file, extension)
+    try:
+        job = upload_jobs.submit(kind, session_user_id(), path)
+    except UploadQueueFullError:
+        os.remove(path)
+        return upload_busy_response()
+    if kind != "image":
+        session['document_job'] = job["id"]
+    return job_response(job["id"], status=202)
+
+@app.route('/jobs/<job_id>')
+def job_status(job_id):
+    return job_response(job_id)
+
+@app.route('/jobs/<job_id>', methods=['DELETE'])
+def cancel_job(job_id):
+    record = upload_jobs.cancel(job_id, session_user_id())
+    if record is None:
+        return jsonify({"status": "error", "message": "Unknown job"}), 404
+    doc_id = record.pop("document_id")
+    if record["status"] in ("done", "error"):
+        return jsonify(record), 409
+    if doc_id and session.get('document_job') == job_id:
+        restore_document(doc_id)
+    return jsonify(record)
+
+# --- Startup ---
+# Heavy libraries are imported by the handlers that use them, so booting the
+# server only pays for Flask. Once requests are being served, a background
+# thread can import them ahead of the first message that needs them.
+PREWARM_IMPORTS = os.environ.get('PREWARM_IMPORTS', '1') == '1'
+PREWARM_MODULES = ["requests", "numpy", "PIL.Image", "PyPDF2", "docx", "transformers"]
+prewarm_started = False
+
+def prewarm_imports():
+    import importlib
+    # SymPy lives in the worker processes unless the pool is disabled
+    modules = PREWARM_MODULES + (["sympy_worker"] if sympy_pool.size <= 0 else [])
+    for name in modules:
+        try:
+            importlib.import_module(name)
+        except Exception as e:
+            print(f"Pre-warm skipped {name}: {e}")
+
+@app.before_request
+def start_prewarm():
+    global prewarm_started
+    if PREWARM_IMPORTS and not prewarm_started:
+        prewarm_started = True
+        threading.Thread(target=prewarm_imports, name="prewarm", daemon=True).start()
+
+# Multi-process deployments (see gunicorn.conf.py) call this in the master
+# before forking: libraries, the BLIP weights and the read-only data are then
+# shared copy-on-write by every worker instead of loaded once per worker.
+CAPTION_PRELOAD = os.environ.get('CAPTION_PRELOAD', '1') == '1'
+
+def preload_for_fork():
+    global prewarm_started
+    import gc
+    prewarm_started = True  # workers inherit the imports, nothing left to pre-warm
+    prewarm_imports()
+    if CAPTION_PRELOAD:
+        try:
+            caption_engine.preload()
+        except Exception as e:
+            print(f"BLIP not preloaded, workers will load it on first use: {e}")
+    # Move everything loaded so far out of the collector's reach, so collections
+    # in the workers don't write to (and un-share) those pages
+    gc.collect()
+    gc.freeze()
+
+def start_background_services():
+    """Start the SymPy workers, BLIP (with CAPTION_WARMUP=1) and the headline refresher.
+
+    Called once in each serving process: by `python main.py`, by gunicorn's
+    post_fork hook and by the ASGI lifespan startup, so the first requests
+    don't pay for them.
+    """
+    sympy_pool.start()
+    if CAPTION_WARMUP:
+        caption_engine.start()
+    headline_cache.start()
+
+def process_memory():
+    """RSS, PSS and shared bytes of this process (PSS splits shared pages between processes)"""
+    memory = {}
+    try:
+        with open("/proc/self/smaps_rollup") as f:
+            for line in f:
+                name, _, rest = line.partition(":")
+                if name in ("Rss", "Pss", "Shared_Clean", "Shared_Dirty"):
+                    memory[name.lower()] = int(rest.split()[0]) * 1024
+    except OSError:
+        import resource
+        memory["rss"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024  # peak, not current
+    memory["shared"] = memory.pop("shared_clean", 0) + memory.pop("shared_dirty", 0)
+    return memory
+
+# --- Profiling ---
+# Opt-in: a sample of requests runs under cProfile and any that take longer
+# than PROFILE_THRESHOLD_MS are dumped to PROFILE_DIR for pstats/snakeviz.
+PROFILE_THRESHOLD_MS = float(os.environ.get('PROFILE_THRESHOLD_MS', 0))
+PROFILE_SAMPLE_RATE = float(os.environ.get('PROFILE_SAMPLE_RATE', 0.1))
+PROFILE_DIR = os.environ.get('PROFILE_DIR', 'profiles')
+profile_lock = threading.Lock()  # one profiled request at a time
+
+@app.before_request
+def start_profile():
+    if PROFILE_THRESHOLD_MS <= 0 or random.random() >= PROFILE_SAMPLE_RATE:
+        return
+    if not profile_lock.acquire(blocking=False):
+        return
+    import cProfile
+    g.profile = cProfile.Profile()
+    g.profile_start = time.perf_counter()
+    g.profile.enable()
+
+@app.teardown_request
+def stop_profile(exc):
+    profile = g.pop('profile', None)
+    if profile is None:
+        return
+    profile.disable()
+    profile_lock.release()
+    elapsed_ms = (time.perf_counter() - g.profile_start) * 1000
+    if elapsed_ms >= PROFILE_THRESHOLD_MS:
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        path = os.path.join(PROFILE_DIR, f"{time.strftime('%Y%m%d-%H%M%S')}-{request.endpoint}-{elapsed_ms:.0f}ms.prof")
+        profile.dump_stats(path)
+        print(f"Slow request ({elapsed_ms:.0f} ms) profiled to {path}")
+
+# --- Routes ---
+@app.route("/")
+def index():
+    return render_template("index.html")
+
+def chat_response(reply):
+    # Handle different reply types
+    if isinstance(reply, dict):
+        response = jsonify(reply)
+    else:
+        response = jsonify({"reply": reply})
+    if g.get("response_cache"):
+        response.headers["X-Cache"] = g.response_cache
+    return response
+
+@app.route("/chat", methods=["POST"])
+def chat():
+    user_message = request.json.get("message", "")
+    reply = assistant_logic(user_message)
+    return chat_response(reply)
+
+def sse_event(data, event=None, event_id=None):
+    lines = []
+    if event:
+        lines.append(f"event: {event}")
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    lines.append(f"data: {json.dumps(data)}")
+    return "\n".join(lines) + "\n\n"
+
+# Stream the current document: Server-Sent Events by default, JSON lines with ?format=jsonl.
+# ?cursor= (or the Last-Event-ID header on an SSE reconnect) resumes where the client left off
+# and ?limit= caps the number of chunks, so a paused client can fetch just the next few.
+@app.route("/read")
+def read_document():
+    doc_id = session.get('document_id')
+    try:
+        cursor = int(request.headers.get('Last-Event-ID') or request.args.get('cursor') or 0)
+        limit = int(request.args['limit']) if 'limit' in request.args else None
+    except ValueError:
+        return jsonify({"status": "error", "message": "cursor and limit must be integers"}), 400
+    if cursor < 0 or document_store.read(doc_id, 0, 0) is None:
+        return jsonify({"status": "error", "message": DOCUMENT_EXPIRED_REPLY["text"]}), 404
+
+    def chunks():
+        # (text, cursor) pairs, then (None, cursor) once the end of the document is reached
+        position = cursor
+        for count, (text, next_position) in enumerate(iter_document_chunks(doc_id, cursor)):
+            if limit is not None and count >= limit:
+                return
+            position = next_position
+            yield text, position
+        yield None, position
+
+    if request.args.get('format') == 'jsonl':
+        def generate():
+            for text, position in chunks():
+                line = {"cursor": position, "done": True} if text is None else {"text": text, "cursor": position}
+                yield json.dumps(line) + "\n"
+        return Response(generate(), mimetype="application/x-ndjson")
+
+    def generate():
+        for text, position in chunks():
+            if text is None:
+                yield sse_event({"cursor": position}, event="end", event_id=position)
+            else:
+                yield sse_event({"text": text, "cursor": position}, event_id=position)
+    return Response(generate(), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+# Test route to verify server is running
+@app.route("/test")
+def test():
+    return "Flask server is running!"
+
+def collect_stats():
+    return {
+        "math": sympy_pool.stats(),
+        "captions": dict(caption_engine.stats(), cache_hits=caption_cache.hits, cache_misses=caption_cache.misses,
+                         shared_hits=caption_cache.shared_hits),
+        "wikipedia": {"cache_hits": wikipedia_cache.hits, "cache_misses": wikipedia_cache.misses,
+                      "shared_hits": wikipedia_cache.shared_hits},
+        "news": headline_cache.stats(),
+        "uploads": upload_jobs.stats(),
+        "responses": response_cache.stats(),
+        "process": dict(process_memory(), pid=os.getpid()),
+    }
+
+# Cache and worker counters
+@app.route("/stats")
+def stats():
+    return jsonify(collect_stats())
+
+# Latency histograms and the /stats counters in Prometheus text format
+@app.route("/metrics")
+def prometheus_metrics():
+    lines = ["# HELP assistant_stat Cache and worker counters (see /stats)", "# TYPE assistant_stat gauge"]
+    for section, values in collect_stats().items():
+        for name, value in values.items():
+            if isinstance(value, (int, float)):
+                lines.append(f'assistant_stat{{section="{section}",name="{name}"}} {int(value) if isinstance(value, bool) else value}')
+    return Response(metrics.render() + "\n".join(lines) + "\n", mimetype="text/plain; version=0.0.4")
+
+if __name__ == "__main__":
+    print("=" * 50)
+    print("Starting Flask Virtual Assistant...")
+    print("=" * 50)
+    print(f"Server will start at: http://127.0.0.1:5000/")
+    print("Press CTRL+C to quit")
+    print("=" * 50)
+    # The debug reloader runs this file twice; only warm up in the serving process
+    if os.environ.get("WERKZEUG_RUN_MAIN") == "true":
+        start_background_services()
     app.run(debug=True, host='0.0.0.0', port=5000)
\ No newline at end of file
@@ -0,0 +1,14 @@
+"""PDF page extraction for the worker processes used on large uploads.
+
+Kept out of main.py so the workers' target doesn't live in the app. "spawn"
+workers still re-import the parent's __main__, so with `python main.py` each
+one re-runs main.py's module level at startup; under gunicorn or uvicorn they
+only pay for PyPDF2.
+"""
+
+
+def extract_page_range(path, start, stop):
+    """Return the text of pages [start, stop) of the PDF at path"""
+    from PyPDF2 import PdfReader
+    reader = PdfReader(path)
+    return [reader.pages[i].extract_text() or "" for i in range(start, stop)]
@@ -0,0 +1,319 @@
+"""Replay a corpus of chat sessions against the app and report latency per intent.
+
+    python replay.py client              # in-process, through the Flask test client
+    python replay.py server              # against a real server (gunicorn by default)
+    python replay.py client --baseline replay-results/<old>.json
+
+Each session in the corpus (replay_corpus.json) is a list of chat messages,
+uploads and streamed read-outs run in order with its own cookie jar; sessions are replayed
+--rounds times by --concurrency workers. Wikipedia, NewsAPI and BLIP are
+replaced by local fakes (see fixtures.py), so the suite runs offline.
+Results are written as JSON so runs can be compared across commits.
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import fixtures
+
+DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_SERVER = "gunicorn -w 2 --threads 4 -b 127.0.0.1:{port} main:app"
+
+
+def make_upload(step):
+    """(filename, bytes) for an upload step; sizes are pages, paragraphs, words or pixels"""
+    kind, size = step["upload"], step.get("size", 10)
+    if kind == "pdf":
+        return "replay.pdf", fixtures.make_pdf(size)
+    if kind == "docx":
+        return "replay.docx", fixtures.make_docx(size)
+    if kind == "txt":
+        return "replay.txt", fixtures.make_document(size).encode()
+    if kind == "image":
+        return "replay.png", fixtures.make_image_bytes(size, size=(size, size * 3 // 4))
+    raise ValueError(f"unknown upload type {kind!r}")
+
+
+def percentile(values, fraction):
+    """Nearest-rank percentile of a sorted list"""
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+def follow_job(status, body, poll):
+    """Poll an /upload job with poll(job_id) until it has a reply; return (status, reply)"""
+    while body.get("id") and not body.get("result") and body.get("status") in ("queued", "running"):
+        status, body = poll(body["id"])
+    if body.get("id"):
+        return status, body.get("result") or {"status": "error", "message": f"upload {body.get('status')}"}
+    return status, body
+
+
+def is_error(status, body):
+    """HTTP failures, upload errors, and document replies that lost their upload"""
+    if status != 200:
+        return True
+    if isinstance(body, dict):
+        return body.get("status") == "error" or str(body.get("text", "")).startswith("Sorry")
+    return False
+
+
+# --- Transports ---
+class ClientTransport:
+    """Drives main.app in this process through the Flask test client"""
+
+    def __init__(self):
+        import main
+        self.app = main.app
+
+    def session(self):
+        client = self.app.test_client()
+
+        def chat(message):
+            response = client.post("/chat", json={"message": message})
+            return response.status_code, response.get_json()
+
+        def upload(filename, data):
+            import io
+            response = client.post("/upload?wait=60", data={"file": (io.BytesIO(data), filename)},
+                                   content_type="multipart/form-data")
+            return follow_job(response.status_code, response.get_json(), poll)
+
+        def poll(job_id):
+            response = client.get(f"/jobs/{job_id}?wait=60")
+            return response.status_code, response.get_json()
+
+        def read():
+            response = client.get("/read?format=jsonl")
+            return response.status_code, json.loads(response.get_data(as_text=True).splitlines()[-1])
+
+        return chat, upload, read
+
+    def peak_rss(self):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024  # KB on Linux
+
+    def close(self):
+        pass
+
+
+class ServerTransport:
+    """Starts the app under a real server and talks to it over HTTP"""
+
+    def __init__(self, command, env):
+        import requests
+        port = fixtures.free_port()
+        self.url = f"http://127.0.0.1:{port}"
+        self.process = subprocess.Popen([sys.executable, "-m"] + command.format(port=port).split(),
+                                        cwd=DIRECTORY, env=env,
+                                        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        self.rss = 0
+        self.done = threading.Event()
+        for _ in range(200):
+            try:
+                requests.get(self.url + "/test", timeout=1)
+                break
+            except requests.ConnectionError:
+                if self.process.poll() is not None:
+                    raise RuntimeError(f"server exited with code {self.process.returncode}")
+                time.sleep(0.1)
+        threading.Thread(target=self._watch_rss, daemon=True).start()
+
+    def session(self):
+        import requests
+        http = requests.Session()
+
+        def chat(message):
+            response = http.post(self.url + "/chat", json={"message": message}, timeout=60)
+            return response.status_code, response.json()
+
+        def upload(filename, data):
+            response = http.post(self.url + "/upload?wait=60", files={"file": (filename, data)}, timeout=120)
+            return follow_job(response.status_code, response.json(), poll)
+
+        def poll(job_id):
+            response = http.get(f"{self.url}/jobs/{job_id}?wait=60", timeout=120)
+            return response.status_code, response.json()
+
+        def read():
+            response = http.get(self.url + "/read?format=jsonl", timeout=120)
+            return response.status_code, json.loads(response.text.splitlines()[-1])
+
+        return chat, upload, read
+
+    def _tree_rss(self):
+        """Current RSS of the server and all of its worker processes, in bytes"""
+        total, pids = 0, [self.process.pid]
+        while pids:
+            pid = pids.pop()
+            try:
+                with open(f"/proc/{pid}/status") as f:
+                    for line in f:
+                        if line.startswith("VmRSS:"):
+                            total += int(line.split()[1]) * 1024
+                with open(f"/proc/{pid}/task/{pid}/children") as f:
+                    pids.extend(int(child) for child in f.read().split())
+            except (OSError, ValueError):
+                continue
+        return total
+
+    def _watch_rss(self):
+        while not self.done.wait(0.05):
+            self.rss = max(self.rss, self._tree_rss())
+
+    def peak_rss(self):
+        return self.rss or None
+
+    def close(self):
+        self.done.set()
+        self.process.terminate()
+        self.process.wait()
+
+
+# --- Replay ---
+def replay(transport, sessions, concurrency, rounds):
+    """Run every session `rounds` times; return ({intent: [(seconds, error)]}, wall time)"""
+    uploads = {}
+    for session in sessions:
+        for step in session["steps"]:
+            if "upload" in step:
+                key = (step["upload"], step.get("size"))
+                uploads.setdefault(key, make_upload(step))
+
+    samples = {}
+    lock = threading.Lock()
+
+    def run(session):
+        chat, upload, read = transport.session()
+        for step in session["steps"]:
+            start = time.perf_counter()
+            try:
+                if "upload" in step:
+                    status, body = upload(*uploads[(step["upload"], step.get("size"))])
+                elif step.get("read"):
+                    status, body = read()
+                    if not body.get("done"):
+                        status = None
+                else:
+                    status, body = chat(step["chat"])
+                error = is_error(status, body)
+            except Exception:
+                error = True
+            elapsed = time.perf_counter() - start
+            with lock:
+                samples.setdefault(step["intent"], []).append((elapsed, error))
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as pool:
+        list(pool.map(run, sessions * rounds))
+    return samples, time.perf_counter() - start
+
+
+def summarize(samples, elapsed, peak_rss):
+    intents = {}
+    for intent, values in sorted(samples.items()):
+        latencies = sorted(seconds * 1000 for seconds, _ in values)
+        intents[intent] = {
+            "count": len(values),
+            "errors": sum(error for _, error in values),
+            "p50_ms": round(percentile(latencies, 0.50), 2),
+            "p95_ms": round(percentile(latencies, 0.95), 2),
+            "p99_ms": round(percentile(latencies, 0.99), 2),
+        }
+    total = sum(len(values) for values in samples.values())
+    return {
+        "requests": total,
+        "seconds": round(elapsed, 3),
+        "throughput_rps": round(total / elapsed, 2),
+        "peak_rss_mb": round(peak_rss / 2 ** 20, 1) if peak_rss else None,
+        "intents": intents,
+    }
+
+
+def print_report(result, baseline=None):
+    print(f"{result['requests']} requests in {result['seconds']}s: {result['throughput_rps']} req/s, "
+          f"peak RSS {result['peak_rss_mb']} MB")
+    print(f"{'intent':16s} {'count':>6s} {'errors':>6s} {'p50 ms':>9s} {'p95 ms':>9s} {'p99 ms':>9s}")
+    for intent, row in result["intents"].items():
+        line = f"{intent:16s} {row['count']:6d} {row['errors']:6d} {row['p50_ms']:9.1f} {row['p95_ms']:9.1f} {row['p99_ms']:9.1f}"
+        old = (baseline or {}).get("intents", {}).get(intent)
+        if old and old["p50_ms"]:
+            line += f"   p50 {100 * (row['p50_ms'] - old['p50_ms']) / old['p50_ms']:+6.1f}%"
+        print(line)
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=DIRECTORY,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def cli():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("mode", choices=["client", "server"])
+    parser.add_argument("--corpus", default=os.path.join(DIRECTORY, "replay_corpus.json"))
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--rounds", type=int, default=3)
+    parser.add_argument("--upstream-delay-ms", type=float, default=50, help="latency of the fake Wikipedia/NewsAPI")
+    parser.add_argument("--caption-ms", type=float, default=50, help="latency of the fake captioner per batch")
+    parser.add_argument("--server", default=DEFAULT_SERVER, help="module and arguments run with python -m")
+    parser.add_argument("--output", help="JSON results path (default replay-results/<commit>-<mode>.json)")
+    parser.add_argument("--baseline", help="earlier results to compare p50 against")
+    args = parser.parse_args()
+
+    with open(args.corpus) as f:
+        sessions = json.load(f)
+
+    upstreams = fixtures.start_fake_upstreams(args.upstream_delay_ms / 1000)
+    env = fixtures.fake_upstream_env(upstreams, caption_ms=args.caption_ms)
+    if args.mode == "client":
+        os.environ.update(env)  # before main is imported
+        transport = ClientTransport()
+    else:
+        # Workers don't share memory, so uploads, job states and "read out" meet in SQLite
+        env = dict(os.environ, **env)
+        directory = tempfile.mkdtemp()
+        env.setdefault("DOCUMENT_STORE", "sqlite")
+        env.setdefault("DOCUMENT_STORE_PATH", os.path.join(directory, "documents.db"))
+        env.setdefault("SHARED_CACHE_PATH", os.path.join(directory, "cache.db"))
+        transport = ServerTransport(args.server, env)
+
+    try:
+        samples, elapsed = replay(transport, sessions, args.concurrency, args.rounds)
+        peak_rss = transport.peak_rss()
+    finally:
+        transport.close()
+        upstreams.shutdown()
+
+    commit = git_commit()
+    result = dict(
+        commit=commit,
+        date=time.strftime("%Y-%m-%dT%H:%M:%S"),
+        mode=args.mode,
+        config={"corpus": os.path.basename(args.corpus), "concurrency": args.concurrency, "rounds": args.rounds,
+                "upstream_delay_ms": args.upstream_delay_ms, "caption_ms": args.caption_ms,
+                "server": args.server if args.mode == "server" else None},
+        **summarize(samples, elapsed, peak_rss),
+    )
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    print_report(result, baseline)
+
+    output = args.output or os.path.join(DIRECTORY, "replay-results", f"{commit}-{args.mode}.json")
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(result, f, indent=2)
+    print(f"results saved to {output}")
+
+
+if __name__ == "__main__":
+    cli()
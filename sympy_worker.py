@@ -0,0 +1,43 @@
+"""SymPy jobs for the advanced math solver.
+
+Kept out of main.py so the worker processes' target doesn't live in the app.
+Workers are started with "spawn", which still re-imports the parent's
+__main__: under gunicorn or uvicorn that is the server script and costs
+little, but with `python main.py` every worker re-runs main.py's module level
+(loading its data and printing its warnings) before it takes jobs.
+"""
+from sympy import symbols, Eq, solve, simplify, diff, integrate, limit, sympify
+
+
+def run_job(operation, expression):
+    """Run one math operation and return the reply text"""
+    try:
+        x = symbols('x')
+        if operation == "solve":
+            lhs, rhs = expression.split("=")
+            equation = Eq(sympify(lhs), sympify(rhs))
+            return f"Solution: {solve(equation, x)}"
+        elif operation == "differentiate":
+            return f"Derivative: {diff(sympify(expression))}"
+        elif operation == "integrate":
+            return f"Integral: {integrate(sympify(expression))}"
+        elif operation == "simplify":
+            return f"Simplified: {simplify(sympify(expression))}"
+        elif operation == "limit":
+            return f"Limit as x approaches ∞: {limit(sympify(expression), x, float('inf'))}"
+        return None
+    except Exception as e:
+        return f"Sorry, I couldn't solve that. Error: {str(e)}"
+
+
+def worker_loop(conn):
+    """Serve (operation, expression) jobs from the parent until the pipe closes"""
+    # Warm up SymPy's lazy internals so the first real job is fast
+    run_job("simplify", "x + x")
+    conn.send("ready")
+    while True:
+        try:
+            operation, expression = conn.recv()
+        except (EOFError, OSError):
+            break
+        conn.send(run_job(operation, expression))
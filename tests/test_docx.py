@@ -0,0 +1,73 @@
+import io
+
+from docx import Document
+from docx.enum.text import WD_BREAK
+from docx.oxml import OxmlElement, parse_xml
+from docx.oxml.ns import nsdecls, qn
+from docx.shared import Inches
+
+import main
+
+
+def add_tab_stops(paragraph, *inches):
+    for position in inches:
+        paragraph.paragraph_format.tab_stops.add_tab_stop(Inches(position))
+
+
+def add_hyperlink(paragraph, text, url):
+    rel_id = paragraph.part.relate_to(url, "http://schemas.openxmlformats.org/officeDocument/2006/relationships/hyperlink", is_external=True)
+    hyperlink = OxmlElement("w:hyperlink")
+    hyperlink.set(qn("r:id"), rel_id)
+    run = OxmlElement("w:r")
+    t = OxmlElement("w:t")
+    t.text = text
+    run.append(t)
+    hyperlink.append(run)
+    paragraph._p.append(hyperlink)
+
+
+def formatted_docx():
+    """Paragraphs with tab stops, real tabs, hyperlinks and breaks, followed by tables"""
+    document = Document()
+    heading = document.add_paragraph("Chapter\t1")
+    add_tab_stops(heading, 1, 2)
+    link = document.add_paragraph("See ")
+    add_hyperlink(link, "the docs", "https://example.com/docs")
+    link.add_run(" for more.")
+    breaks = document.add_paragraph("Line one")
+    breaks.runs[0].add_break()
+    breaks.add_run("line two")
+    breaks.runs[1].add_break(WD_BREAK.PAGE)
+    breaks.add_run("after the page break")
+    hyphen = document.add_paragraph("non")
+    hyphen.runs[0]._r.append(OxmlElement("w:noBreakHyphen"))
+    hyphen.add_run("breaking")
+    # A text box: its paragraph is nested inside a run and isn't part of the text
+    boxed = document.add_paragraph("Outside the box")
+    boxed.runs[0]._r.append(parse_xml(
+        f'<w:pict {nsdecls("w")} xmlns:v="urn:schemas-microsoft-com:vml"><v:shape><v:textbox><w:txbxContent>'
+        '<w:p><w:r><w:t>Inside the box</w:t></w:r></w:p></w:txbxContent></v:textbox></v:shape></w:pict>'))
+    document.add_paragraph("   ")
+    table = document.add_table(rows=2, cols=3)
+    for r, row in enumerate(table.rows):
+        for c, cell in enumerate(row.cells):
+            cell.text = "" if (r, c) == (1, 1) else f"Item {r}.{c}\tvalue"
+            add_tab_stops(cell.paragraphs[0], 1)
+    table.cell(0, 0).add_paragraph("second line")
+    add_hyperlink(table.cell(1, 2).paragraphs[0], " (link)", "https://example.com/item")
+    out = io.BytesIO()
+    document.save(out)
+    return out.getvalue()
+
+
+def test_streaming_reader_matches_python_docx():
+    data = formatted_docx()
+    expected = main.read_docx_document(io.BytesIO(data))
+    assert "\n".join(main.iter_docx_blocks(io.BytesIO(data))) == expected
+    assert expected.startswith("Chapter\t1\n")
+
+
+def test_read_docx_file_uses_streaming_reader():
+    text = main.read_docx_file(io.BytesIO(formatted_docx()))
+    assert text.splitlines()[0] == "Chapter\t1"
+    assert "Inside the box" not in text
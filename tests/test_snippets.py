@@ -0,0 +1,55 @@
+import json
+import os
+
+import pytest
+
+import main
+
+
+def write_programs(path, programs):
+    with open(path, "r+" if os.path.exists(path) else "w") as f:
+        f.truncate(0)
+        f.write(json.dumps(programs))
+    # Make sure the rewrite is visible to the mtime check even on coarse clocks
+    mtime = os.path.getmtime(path) + 5
+    os.utime(path, (mtime, mtime))
+
+
+def chat(client, message):
+    return client.post("/chat", json={"message": message}).get_json()["reply"]
+
+
+@pytest.fixture
+def programs_path(tmp_path, monkeypatch):
+    """A programs.json in tmp_path, served by the app's router for the length of the test"""
+    path = tmp_path / "programs.json"
+    write_programs(path, {"fibonacci": "def fib(n): pass", "bubble sort": "def bubble(a): pass"})
+    monkeypatch.setattr(main, "snippet_index", main.SnippetIndex(str(path), check_interval=3600))
+    main.register_program_intent(main.intent_router)
+    main.response_cache.clear()
+    yield path
+    monkeypatch.undo()
+    main.register_program_intent(main.intent_router)
+    main.response_cache.clear()
+
+
+def test_in_place_rewrite_rebuilds_program_intents(programs_path):
+    client = main.app.test_client()
+    assert "def fib(n)" in chat(client, "fibonacci")
+
+    # Same file, new contents; the mtime check interval hasn't passed
+    write_programs(programs_path, {"quick sort": "def quick(a): pass", "bubble sort": "def bubble(items): pass"})
+    assert "def bubble(items)" in chat(client, "bubble sort")
+    # The read above reindexed the file, so the router picks up the new key...
+    assert "def quick(a)" in chat(client, "quick sort")
+    # ...and drops the removed one instead of failing
+    response = client.post("/chat", json={"message": "fibonacci"})
+    assert response.status_code == 200
+    assert "def fib" not in response.get_json()["reply"]
+
+
+def test_removed_key_is_not_an_error(programs_path):
+    write_programs(programs_path, {"quick sort": "def quick(a): pass"})
+    # The router still has the old trigger until the next reload check
+    assert main.program_reply("fibonacci", "fibonacci") is None
+    assert main.snippet_index.reload_if_changed()